@@ -3,8 +3,12 @@ KTBR - Privacy Protection Telegram Bot
 Main entry point - starts the bot.
 """
 
+import signal
+import hashlib
+
 from telegram import Update, BotCommand
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     CommandHandler,
     MessageHandler,
@@ -12,7 +16,23 @@ from telegram.ext import (
     filters,
 )
 
-from config import BOT_TOKEN, ALLOWED_USERNAMES, logger
+from config import (
+    BOT_TOKEN,
+    OWNER_ID,
+    ALLOWED_USERNAMES,
+    COMMANDS_HASH_FILE,
+    TELEGRAM_HTTP_VERSION,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    logger,
+)
+from utils import store
+from processors.pool import shutdown_pool, warm_up_pool
+from utils.queue_manager import cancel_active_tasks, run_in_background
+from utils.files import temp_dirs
+from handlers.common import flush_message_deletions
 from handlers import (
     start_command,
     upload_command,
@@ -32,8 +52,47 @@ from handlers import (
 )
 
 
+class KTBRApplication(Application):
+    """Application that aborts running jobs and background tasks on stop instead of waiting for them."""
+    
+    async def stop(self):
+        # Application.stop() waits for running handlers, so cancel jobs first
+        await cancel_active_tasks()
+        # Stopping the JobQueue drops pending jobs; delete those results now instead
+        await flush_message_deletions(self)
+        await super().stop()
+
+
+def _http_version() -> str:
+    """The configured Bot API HTTP version, falling back to 1.1 if HTTP/2 support is missing."""
+    if TELEGRAM_HTTP_VERSION == "2":
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("TELEGRAM_HTTP_VERSION=2 but the h2 package is not installed, using HTTP/1.1")
+            return "1.1"
+    return TELEGRAM_HTTP_VERSION
+
+
+def _webhook_secret() -> str:
+    """Secret Telegram sends with each webhook update, so forged requests are rejected."""
+    return WEBHOOK_SECRET or hashlib.sha256(BOT_TOKEN.encode()).hexdigest()
+
+
+def _rate_limiter():
+    """PTB's flood-limit throttling (30 requests/s overall) if the rate-limiter extra is installed."""
+    try:
+        return AIORateLimiter()
+    except RuntimeError:
+        logger.info("aiolimiter not installed, Bot API calls are not rate limited")
+        return None
+
+
 async def post_init(application: Application):
     """Set up bot commands after initialization."""
+    # Spawn the workers and load their models while Telegram setup runs
+    run_in_background(warm_up_pool())
+    
     commands = [
         BotCommand("start", "Show welcome message and info"),
         BotCommand("mode", "Switch Face Blur / Voice modes"),
@@ -42,8 +101,33 @@ async def post_init(application: Application):
         BotCommand("report", "Report a bug"),
         BotCommand("clear", "How to delete your chat"),
     ]
+    
+    # Telegram keeps the command list server-side; only push it when it changed
+    commands_hash = hashlib.sha256(
+        repr((application.bot.id, [(c.command, c.description) for c in commands])).encode()
+    ).hexdigest()
+    try:
+        with open(COMMANDS_HASH_FILE, 'r') as f:
+            if f.read().strip() == commands_hash:
+                logger.info("Bot commands unchanged, skipping registration")
+                return
+    except OSError:
+        pass
+    
     await application.bot.set_my_commands(commands)
     logger.info("Bot commands registered with Telegram")
+    try:
+        with open(COMMANDS_HASH_FILE, 'w') as f:
+            f.write(commands_hash)
+    except OSError as e:
+        logger.warning(f"Could not save bot commands hash: {e}")
+
+
+async def post_shutdown(application: Application):
+    """Release resources before the process exits."""
+    shutdown_pool()
+    temp_dirs.clear()
+    store.close()
 
 
 def main():
@@ -61,7 +145,7 @@ def main():
     print("=" * 60)
     print("KTBR - Privacy Protection Telegram Bot")
     print("=" * 60)
-    print(f"Allowed usernames: {ALLOWED_USERNAMES}")
+    print(f"Allowed usernames: {sorted(ALLOWED_USERNAMES)}")
     print("=" * 60)
     
     # Build application with concurrent updates enabled
@@ -69,8 +153,13 @@ def main():
     application = (
         Application.builder()
         .token(BOT_TOKEN)
+        .application_class(KTBRApplication)
+        # Bot API calls share one pool (256 connections by default); optionally over HTTP/2
+        .http_version(_http_version())
+        .rate_limiter(_rate_limiter())
         .concurrent_updates(True)  # CRITICAL: Allows handlers to run in parallel
         .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .build()
     )
     
@@ -83,7 +172,8 @@ def main():
     application.add_handler(CommandHandler("clear", clear_command))
     
     # Owner Commands
-    application.add_handler(CommandHandler("status", status_command))
+    # Non-owners are filtered out before dispatch (silently ignored)
+    application.add_handler(CommandHandler("status", status_command, filters=filters.User(user_id=OWNER_ID)))
     
     # Add callback handler for inline buttons (mode selection)
     application.add_handler(CallbackQueryHandler(mode_callback, pattern="^mode_"))
@@ -110,9 +200,25 @@ def main():
     application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_unknown))
     
-    # Start polling
+    # On these signals the updater stops and KTBRApplication.stop()
+    # cancels running jobs and background tasks
+    run_kwargs = {
+        "allowed_updates": Update.ALL_TYPES,
+        "stop_signals": (signal.SIGINT, signal.SIGTERM, signal.SIGABRT),
+    }
     print("Bot is running... Press Ctrl+C to stop.")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        # Telegram pushes each update as it happens
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path="webhook",
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/webhook",
+            secret_token=_webhook_secret(),
+            **run_kwargs,
+        )
+    else:
+        application.run_polling(**run_kwargs)
 
 
 if __name__ == "__main__":
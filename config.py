@@ -4,7 +4,10 @@ All configuration settings and constants.
 """
 
 import os
+import queue
+import atexit
 import logging
+from logging.handlers import QueueHandler, QueueListener
 
 # =============================================================================
 # Load .env file
@@ -19,10 +22,21 @@ except ImportError:
 # LOGGING
 # =============================================================================
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Handlers only enqueue records; a background thread formats and writes them
+# so a slow stdout (pipe, journald) never blocks the event loop
+log_queue = queue.SimpleQueue()
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_listener = QueueListener(log_queue, _stream_handler)
+
+_root_logger = logging.getLogger()
+if not any(isinstance(h, QueueHandler) for h in _root_logger.handlers):
+    _root_logger.addHandler(QueueHandler(log_queue))
+    _root_logger.setLevel(logging.INFO)
+    log_listener.start()
+    # Drain anything still queued at interpreter exit
+    atexit.register(log_listener.stop)
+
 logger = logging.getLogger("ktbr")
 
 # =============================================================================
@@ -32,6 +46,19 @@ logger = logging.getLogger("ktbr")
 # Bot token from @BotFather
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 
+# HTTP version for Bot API calls: "2" multiplexes concurrent requests over one
+# connection per host (needs the h2 package, e.g. pip install "httpx[http2]")
+TELEGRAM_HTTP_VERSION = os.getenv("TELEGRAM_HTTP_VERSION", "1.1")
+
+# Public HTTPS base URL for webhook mode (e.g. https://bot.example.com); Telegram
+# then pushes updates instead of the bot long-polling for them. Empty = polling.
+# Needs the webhooks extra: pip install "python-telegram-bot[webhooks]"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+# Checked against the X-Telegram-Bot-Api-Secret-Token header; derived from BOT_TOKEN if unset
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
 # Owner ID for admin notifications
 raw_owner_id = os.getenv("OWNER_ID", "0")
 try:
@@ -42,7 +69,7 @@ except ValueError:
 
 # Allowed usernames (comma-separated)
 _usernames_str = os.getenv("ALLOWED_USERNAMES", "")
-ALLOWED_USERNAMES = [u.strip() for u in _usernames_str.split(",") if u.strip()]
+_allowed_usernames = [u.strip() for u in _usernames_str.split(",") if u.strip()]
 
 # Load additional usernames from whitelist.txt
 WHITELIST_FILE = os.getenv("WHITELIST_FILE", "whitelist.txt")
@@ -52,11 +79,14 @@ if os.path.exists(WHITELIST_FILE):
             for line in f:
                 line = line.strip()
                 if line and not line.startswith("#"):
-                    ALLOWED_USERNAMES.append(line)
-        logger.info(f"Loaded {len(ALLOWED_USERNAMES)} allowed usernames")
+                    _allowed_usernames.append(line)
+        logger.info(f"Loaded {len(_allowed_usernames)} allowed usernames")
     except Exception as e:
         logger.error(f"Error reading whitelist file: {e}")
 
+# Lowercased for O(1) case-insensitive lookups (Telegram usernames ignore case)
+ALLOWED_USERNAMES = frozenset(u.lower() for u in _allowed_usernames)
+
 # =============================================================================
 # FILE LIMITS
 # =============================================================================
@@ -65,16 +95,27 @@ MAX_VIDEO_DURATION_SECONDS = 30
 MAX_VIDEO_SIZE_MB = 100
 MAX_IMAGE_SIZE_MB = 10
 MAX_IMAGE_DIMENSION = 1920  # FHD
+# Image documents carry no dimensions, so they are bounded by pixel count when
+# decoded instead (checked from the PNG/JPEG header before decoding); the
+# result keeps the uploaded resolution
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(24_000_000)))
 
 # =============================================================================
 # PATHS
 # =============================================================================
 
-# Data file to store authorized user IDs
 DATA_DIR = os.getenv("DATA_DIR", ".")
+
+# SQLite database for authorized users, access requests and user modes
+DATABASE_FILE = os.path.join(DATA_DIR, "ktbr.db")
+
+# Legacy JSON files, imported into the database on first start
 AUTHORIZED_IDS_FILE = os.path.join(DATA_DIR, "authorized_ids.json")
 ACCESS_REQUESTS_FILE = os.path.join(DATA_DIR, "access_requests.json")
 
+# Hash of the last command list pushed to Telegram
+COMMANDS_HASH_FILE = os.path.join(DATA_DIR, "cmd_hash")
+
 # =============================================================================
 # PROCESSING ESTIMATES
 # =============================================================================
@@ -89,6 +130,13 @@ ESTIMATE_IMAGE_SEC_PER_MB = 0.5
 # Time in seconds before bot messages are auto-deleted
 AUTO_DELETE_SECONDS = int(os.getenv("AUTO_DELETE_SECONDS", "30"))
 
+# =============================================================================
+# ACCESS REQUESTS
+# =============================================================================
+
+# Seconds a user has to send their access-request note before the flow is dropped
+ACCESS_REQUEST_TIMEOUT_SECONDS = 300
+
 # =============================================================================
 # FACE DETECTION MODEL
 # =============================================================================
@@ -96,21 +144,57 @@ AUTO_DELETE_SECONDS = int(os.getenv("AUTO_DELETE_SECONDS", "30"))
 YUNET_MODEL = "face_detection_yunet_2023mar.onnx"
 YUNET_URL = "https://github.com/opencv/opencv_zoo/raw/main/models/face_detection_yunet/face_detection_yunet_2023mar.onnx"
 
+# Detector backend: "opencv" runs the FP32 model through cv2.FaceDetectorYN,
+# "onnxruntime" runs the int8-quantized model (needs the onnxruntime package)
+YUNET_BACKEND = os.getenv("YUNET_BACKEND", "opencv")
+YUNET_INT8_MODEL = "face_detection_yunet_2023mar_int8.onnx"
+YUNET_INT8_URL = "https://github.com/opencv/opencv_zoo/raw/main/models/face_detection_yunet/face_detection_yunet_2023mar_int8.onnx"
+
+# Run the detector on every Nth video frame; KCF trackers bridge the gaps.
+# KCF needs opencv-contrib; with plain opencv(-headless) every frame is detected
+VIDEO_DETECT_EVERY_N_FRAMES = 3
+
+# Longest side (px) of the downscaled video frame fed to the detector
+VIDEO_DETECT_MAX_DIMENSION = int(os.getenv("VIDEO_DETECT_MAX_DIMENSION", "640"))
+
+# Longest side (px) of the downscaled image fed to the detector; detection cost
+# scales with its square, lower it on slow hosts at the cost of missing tiny faces
+IMAGE_DETECT_MAX_DIMENSION = int(os.getenv("IMAGE_DETECT_MAX_DIMENSION", "960"))
+
+# JPEG quality (1-100) for blurred image results; blurred regions hide the
+# artifacts, and 85 gives roughly half the upload size of OpenCV's default 95
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# Memory budget (MB) for recently blurred images, reused when the same file is sent again
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", "64"))
+
+# =============================================================================
+# VIDEO ENCODING
+# =============================================================================
+
+# H.264 encoder for the final ffmpeg pass: "auto" probes for a working hardware
+# encoder (h264_nvenc, h264_qsv, h264_vaapi, h264_videotoolbox) and falls back
+# to libx264; set a specific encoder name to skip probing
+VIDEO_ENCODER = os.getenv("VIDEO_ENCODER", "auto")
+
+# Render node used by h264_vaapi
+VAAPI_DEVICE = os.getenv("VAAPI_DEVICE", "/dev/dri/renderD128")
+
 
 
 # =============================================================================
 # ACTIVE TASKS (for cancellation)
 # =============================================================================
 
-# Stores user_id -> {"temp_dir": path, "cancel_event": threading.Event}
+# Stores user_id -> utils.queue_manager.TaskHandle
 active_tasks: dict = {}
 
 # =============================================================================
 # USER MODES (face blur vs voice anonymization)
 # =============================================================================
 
-# Stores user_id -> {"mode": "face" | "voice", "voice_level": "fast" | "secure"}
-# Default mode is "face" (face blur)
+# Stores user_id -> utils.store.UserMode (mode "face" | "voice", voice_level "fast" | "secure")
+# Default mode is "face" (face blur). Cache of the user_modes table in utils.store
 user_modes: dict = {}
 
 # =============================================================================
@@ -120,11 +204,23 @@ user_modes: dict = {}
 # Maximum number of concurrent processing jobs (across all users)
 MAX_CONCURRENT_JOBS = 2
 
-# Queue of users waiting for processing: list of {"user_id": int, "chat_id": int, "timestamp": float, "file_info": dict}
-processing_queue: list = []
+# Worker processes for blur/voice jobs (more than MAX_CONCURRENT_JOBS would sit idle)
+PROCESS_POOL_WORKERS = min(MAX_CONCURRENT_JOBS, os.cpu_count() or 1)
+
+# Queue of users waiting for processing, in arrival order (dicts keep insertion order):
+# user_id -> {"user_id": int, "chat_id": int, "timestamp": float, "file_size_mb": float, "file_id": str, ...}
+processing_queue: dict = {}
 
 # Cooldown after receiving processed media (seconds)
 COOLDOWN_SECONDS = 30
 
 # Stores user_id -> timestamp when cooldown ends
 user_cooldowns: dict = {}
+
+# Token bucket for plain-text messages: up to RATE_LIMIT_BURST messages at
+# once, refilled at RATE_LIMIT_PER_SECOND; excess is dropped before auth
+RATE_LIMIT_BURST = 5.0
+RATE_LIMIT_PER_SECOND = 1.0
+
+# Stores chat_id -> (last_timestamp, tokens)
+rate_buckets: dict = {}
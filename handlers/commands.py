@@ -3,8 +3,11 @@ KTBR - Command Handlers
 /start, /upload, /stop, /clear, /mode commands
 """
 
+import asyncio
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from telegram.constants import ParseMode
 
 from config import (
     MAX_VIDEO_DURATION_SECONDS, 
@@ -13,31 +16,28 @@ from config import (
     MAX_IMAGE_DIMENSION,
     AUTO_DELETE_SECONDS,
     active_tasks,
-    user_modes,
     logger
 )
-from utils.auth import is_user_allowed
+from utils.queue_manager import is_in_queue, remove_from_queue, notify_next_in_queue, run_in_background
+from utils import store
 from utils.decorators import require_auth
+from handlers.common import get_user_settings
 
 
-@require_auth
-async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /start command."""
-    user = update.effective_user
-    username = user.username
-    user_id = user.id
-    
-    # Get current mode
-    current_mode = get_user_mode(user_id)
-    mode_emoji = "🎭" if current_mode == "face" else "🔊"
-    mode_name = "Face Blur" if current_mode == "face" else "Voice Anonymize"
-    
-    welcome_message = f"""
-👋 Welcome, @{username}!
+# Mode -> (emoji, display name)
+MODE_META = {
+    "face": ("🎭", "Face Blur"),
+    "voice": ("🔊", "Voice Anonymize"),
+}
+
+# Rendered once at import; a reply is just prefix + username + the body for the user's mode
+WELCOME_PREFIX = "\n👋 Welcome, @"
+
+_WELCOME_BODY = f"""!
 
 🔒 **KTBR - Privacy Protection Bot**
 
-{mode_emoji} **Current Mode: {mode_name}**
+{{mode_emoji}} **Current Mode: {{mode_name}}**
 Use /mode to switch modes.
 
 📤 **Just send me a file:**
@@ -63,14 +63,14 @@ Use /mode to switch modes.
 
 Simply upload a file and I'll process it for you!
 """
-    await update.message.reply_text(welcome_message, parse_mode='Markdown')
 
+WELCOME_BODIES = {
+    mode: _WELCOME_BODY.format(mode_emoji=emoji, mode_name=name)
+    for mode, (emoji, name) in MODE_META.items()
+}
 
-@require_auth
-async def upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /upload command - explains how to upload."""
-    
-    upload_message = f"""
+
+UPLOAD_MESSAGE = f"""
 📤 **How to Upload Files**
 
 **Option 1: Direct Send**
@@ -99,7 +99,57 @@ Click 📎 and select your file.
 ⏳ Processing time depends on file size.
 Use /stop to cancel if needed.
 """
-    await update.message.reply_text(upload_message, parse_mode='Markdown')
+
+CLEAR_MESSAGE = """
+🗑️ **How to Clear Your Chat**
+
+**Bot messages** are auto-deleted after processing.
+
+**Your messages** must be deleted manually:
+
+━━━━━━━━━━━━━━━━━━━━━
+
+📱 **On Mobile (iOS/Android):**
+1. Long-press on your message
+2. Tap "Delete"
+3. Select "Delete for me and bot" (if available)
+4. Or select "Delete for me"
+
+💻 **On Desktop:**
+1. Right-click on your message
+2. Click "Delete"
+3. Check "Also delete for the bot" (if available)
+4. Click "Delete"
+
+━━━━━━━━━━━━━━━━━━━━━
+
+🔒 **For maximum privacy:**
+• Delete the entire chat:
+  - Click chat name at top
+  - Scroll down → "Delete Chat"
+
+⚠️ **Important:** 
+The bot cannot delete YOUR messages due to Telegram's privacy policy.
+Only YOU can delete what you sent.
+"""
+
+
+@require_auth
+async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /start command."""
+    user = update.effective_user
+    
+    # Get current mode
+    current_mode = get_user_mode(user.id)
+    body = WELCOME_BODIES[current_mode]
+    
+    await update.message.reply_text(f"{WELCOME_PREFIX}{user.username}{body}", parse_mode=ParseMode.MARKDOWN)
+
+
+@require_auth
+async def upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /upload command - explains how to upload."""
+    await update.message.reply_text(UPLOAD_MESSAGE, parse_mode=ParseMode.MARKDOWN)
 
 
 @require_auth
@@ -108,19 +158,15 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_id = user.id
     
-    # Imports for queue management
-    from utils.queue_manager import is_in_queue, remove_from_queue, notify_next_in_queue
-    from config import active_tasks
-    
     # 1. Check if they are in the queue
     if is_in_queue(user_id):
         remove_from_queue(user_id)
         await update.message.reply_text(
             "🛑 **Left the queue.**\n\nYour file will not be processed.",
-            parse_mode='Markdown'
+            parse_mode=ParseMode.MARKDOWN
         )
         # Notify whoever is next to update their positions
-        asyncio.create_task(notify_next_in_queue(context))
+        run_in_background(notify_next_in_queue(context))
         return
 
     # 2. Check if they have an active task
@@ -131,65 +177,46 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    cancel_event = active_tasks[user_id].get("cancel_event")
+    cancel_event = active_tasks[user_id].cancel_event
     if cancel_event:
         cancel_event.set()
-        logger.info(f"User {user_id} - cancel event SET")
+        logger.info("User %s - cancel event SET", user_id)
     
     await update.message.reply_text(
         "🛑 **Stopping processing...**\n\n"
         "The current operation is being aborted.\n"
         "Please wait for confirmation.",
-        parse_mode='Markdown'
+        parse_mode=ParseMode.MARKDOWN
     )
-    logger.info(f"User {user_id} requested cancellation")
+    logger.info("User %s requested cancellation", user_id)
 
 
 @require_auth
 async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /clear command - explains how to delete chat."""
-    user = update.effective_user
-    
-    clear_message = """
-🗑️ **How to Clear Your Chat**
-
-**Bot messages** are auto-deleted after processing.
-
-**Your messages** must be deleted manually:
-
-━━━━━━━━━━━━━━━━━━━━━
+    await update.message.reply_text(CLEAR_MESSAGE, parse_mode=ParseMode.MARKDOWN)
 
-📱 **On Mobile (iOS/Android):**
-1. Long-press on your message
-2. Tap "Delete"
-3. Select "Delete for me and bot" (if available)
-4. Or select "Delete for me"
-
-💻 **On Desktop:**
-1. Right-click on your message
-2. Click "Delete"
-3. Check "Also delete for the bot" (if available)
-4. Click "Delete"
-
-━━━━━━━━━━━━━━━━━━━━━
-
-🔒 **For maximum privacy:**
-• Delete the entire chat:
-  - Click chat name at top
-  - Scroll down → "Delete Chat"
 
-⚠️ **Important:** 
-The bot cannot delete YOUR messages due to Telegram's privacy policy.
-Only YOU can delete what you sent.
-"""
-    await update.message.reply_text(clear_message, parse_mode='Markdown')
+# /mode reply per current mode; InlineKeyboardMarkup is immutable, so one instance is shared
+_MODE_MESSAGE = (
+    "🔧 **Select Processing Mode**\n\n"
+    "Current mode: {emoji} **{name}**\n\n"
+    "🎭 **Face Blur** - Blur faces in videos/images\n"
+    "🔊 **Voice Anonymize** - Alter voice in videos (no images)\n\n"
+    "Tap a button below to switch:"
+)
+MODE_MESSAGES = {
+    mode: _MODE_MESSAGE.format(emoji=emoji, name=name)
+    for mode, (emoji, name) in MODE_META.items()
+}
+MODE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"{emoji} {name}", callback_data=f"mode_{mode}") for mode, (emoji, name) in MODE_META.items()]
+])
 
 
 def get_user_mode(user_id: int) -> str:
     """Get user's current mode, default is 'face'."""
-    if user_id not in user_modes:
-        user_modes[user_id] = {"mode": "face", "voice_level": "fast"}
-    return user_modes[user_id]["mode"]
+    return get_user_settings(user_id).mode
 
 
 @require_auth
@@ -198,25 +225,11 @@ async def mode_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     
     current_mode = get_user_mode(user.id)
-    current_emoji = "🎭" if current_mode == "face" else "🔊"
-    current_name = "Face Blur" if current_mode == "face" else "Voice Anonymize"
-    
-    keyboard = [
-        [
-            InlineKeyboardButton("🎭 Face Blur", callback_data="mode_face"),
-            InlineKeyboardButton("🔊 Voice Anonymize", callback_data="mode_voice"),
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
     
     await update.message.reply_text(
-        f"🔧 **Select Processing Mode**\n\n"
-        f"Current mode: {current_emoji} **{current_name}**\n\n"
-        f"🎭 **Face Blur** - Blur faces in videos/images\n"
-        f"🔊 **Voice Anonymize** - Alter voice in videos (no images)\n\n"
-        f"Tap a button below to switch:",
-        parse_mode='Markdown',
-        reply_markup=reply_markup
+        MODE_MESSAGES[current_mode],
+        parse_mode=ParseMode.MARKDOWN,
+        reply_markup=MODE_KEYBOARD
     )
 
 
@@ -228,27 +241,27 @@ async def mode_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
     callback_data = query.data
     
-    # Initialize user mode if not exists
-    if user_id not in user_modes:
-        user_modes[user_id] = {"mode": "face", "voice_level": "fast"}
+    settings = get_user_settings(user_id)
     
     if callback_data == "mode_face":
-        user_modes[user_id]["mode"] = "face"
+        settings.mode = "face"
+        await asyncio.to_thread(store.save_user_mode, user_id, settings.mode, settings.voice_level)
         await query.edit_message_text(
             "✅ **Mode switched to: 🎭 Face Blur**\n\n"
             "Send a video or image to blur faces.\n\n"
             "Use /mode to switch modes anytime.",
-            parse_mode='Markdown'
+            parse_mode=ParseMode.MARKDOWN
         )
-        logger.info(f"User {user_id} switched to Face Blur mode")
+        logger.info("User %s switched to Face Blur mode", user_id)
         
     elif callback_data == "mode_voice":
-        user_modes[user_id]["mode"] = "voice"
+        settings.mode = "voice"
+        await asyncio.to_thread(store.save_user_mode, user_id, settings.mode, settings.voice_level)
         await query.edit_message_text(
             "✅ **Mode switched to: 🔊 Voice Anonymize**\n\n"
             "Send a **video** to anonymize the voice.\n"
             "⚠️ Images are not supported in this mode.\n\n"
             "Use /mode to switch modes anytime.",
-            parse_mode='Markdown'
+            parse_mode=ParseMode.MARKDOWN
         )
-        logger.info(f"User {user_id} switched to Voice Anonymize mode")
+        logger.info("User %s switched to Voice Anonymize mode", user_id)
@@ -0,0 +1,100 @@
+"""
+KTBR - Shared Handler Helpers
+User mode lookup and auto-delete used by several handlers.
+"""
+
+import asyncio
+
+from telegram.ext import ContextTypes
+
+from config import user_modes, logger
+from utils import store
+from utils.queue_manager import run_in_background
+
+# JobQueue name shared by all auto-delete jobs, so shutdown can find them
+AUTO_DELETE_JOB = "auto_delete"
+
+
+def get_user_settings(user_id: int) -> store.UserMode:
+    """Get user's mode settings, loading or defaulting them."""
+    if user_id not in user_modes:
+        user_modes[user_id] = store.load_user_mode(user_id) or store.UserMode()
+    return user_modes[user_id]
+
+
+async def _delete_messages(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_ids: list):
+    """Delete messages now, batched where possible."""
+    try:
+        # One deleteMessages call (up to 100 ids) instead of a request per message
+        try:
+            await context.bot.delete_messages(chat_id=chat_id, message_ids=message_ids)
+            return
+        except Exception as e:
+            logger.warning(f"Batch delete failed, deleting one by one: {e}")
+        results = await asyncio.gather(
+            *(context.bot.delete_message(chat_id=chat_id, message_id=msg_id) for msg_id in message_ids),
+            return_exceptions=True
+        )
+        for msg_id, result in zip(message_ids, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Could not delete message {msg_id}: {result}")
+    except Exception as e:
+        logger.error(f"Error in delete_messages_after_delay: {e}")
+
+
+async def delete_messages_after_delay(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_ids: list, delay: int):
+    """Delete messages after a delay, or right away if the timer is cancelled."""
+    try:
+        await asyncio.sleep(delay)
+    except asyncio.CancelledError:
+        # Shutdown cancels pending timers; delete now rather than leave results in the chat
+        await _delete_messages(context, chat_id, message_ids)
+        raise
+    await _delete_messages(context, chat_id, message_ids)
+
+
+async def collect_ack_message(ack_task: asyncio.Task, messages_to_delete: list):
+    """
+    Wait for a job's "Processing..." message and queue it for deletion.
+    Safe to call again once awaited; a failed send is only logged.
+    """
+    try:
+        msg = await ack_task
+    except Exception as e:
+        logger.warning(f"Could not send processing message: {e}")
+        return
+    if msg.message_id not in messages_to_delete:
+        messages_to_delete.append(msg.message_id)
+
+
+async def _delete_messages_job(context: ContextTypes.DEFAULT_TYPE):
+    """JobQueue callback for schedule_message_deletion."""
+    await _delete_messages(context, context.job.data["chat_id"], context.job.data["message_ids"])
+
+
+def schedule_message_deletion(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_ids: list, delay: int):
+    """
+    Delete messages after a delay.
+    
+    Runs as a JobQueue job, so no task sleeps through the delay; without a
+    job queue (job-queue extra missing) a background timer task is used instead.
+    """
+    if context.job_queue is None:
+        run_in_background(delete_messages_after_delay(context, chat_id, message_ids, delay))
+        return
+    context.job_queue.run_once(
+        _delete_messages_job, delay,
+        data={"chat_id": chat_id, "message_ids": message_ids},
+        chat_id=chat_id,
+        name=AUTO_DELETE_JOB,
+    )
+
+
+async def flush_message_deletions(application):
+    """Run all pending auto-delete jobs now (on shutdown) rather than dropping them."""
+    if application.job_queue is None:
+        return
+    jobs = application.job_queue.get_jobs_by_name(AUTO_DELETE_JOB)
+    for job in jobs:
+        job.schedule_removal()
+    await asyncio.gather(*(job.run(application) for job in jobs), return_exceptions=True)
@@ -5,22 +5,20 @@ Handles photo uploads and processing with auto-delete.
 
 import os
 import asyncio
-import tempfile
-from io import BytesIO
+import hashlib
 
 from telegram import Update
 from telegram.ext import ContextTypes
+from telegram.constants import ParseMode
 
 from config import (
     MAX_IMAGE_SIZE_MB,
     MAX_IMAGE_DIMENSION,
     ESTIMATE_IMAGE_SEC_PER_MB,
     AUTO_DELETE_SECONDS,
-    user_modes,
     active_tasks,
     logger
 )
-from utils.auth import is_user_allowed
 from utils.queue_manager import (
     is_server_busy,
     is_on_cooldown,
@@ -31,34 +29,75 @@ from utils.queue_manager import (
     estimate_wait_time,
     format_wait_time,
     notify_next_in_queue,
+    run_in_background,
+    start_job,
+    TaskHandle,
 )
-from processors.face_blur import blur_faces_in_image
-from utils.decorators import require_auth
+from processors.face_blur import blur_faces_in_image_bytes
+from handlers.common import get_user_settings, schedule_message_deletion, collect_ack_message
+from utils.decorators import require_auth, rate_limit
+from utils.files import download_telegram_bytes, send_result_bytes
+from utils.result_cache import image_results
+from processors.pool import run_in_pool
 
 
-def get_user_mode(user_id: int) -> dict:
-    """Get user's current mode settings."""
-    if user_id not in user_modes:
-        user_modes[user_id] = {"mode": "face", "voice_level": "fast"}
-    return user_modes[user_id]
-
-
-async def delete_messages_after_delay(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_ids: list, delay: int):
-    """Delete messages after a delay."""
+async def _process_image(context, chat_id, user_id, file_id, file_name, processing_text, task_type):
+    """Download, blur and send back an image (shared by photos and image documents)."""
+    messages_to_delete = []
+    
+    # Acknowledge while the file downloads instead of before it
+    ack_task = asyncio.create_task(context.bot.send_message(chat_id=chat_id, text=processing_text, parse_mode=ParseMode.MARKDOWN))
+    
     try:
-        await asyncio.sleep(delay)
-        for msg_id in message_ids:
-            try:
-                await context.bot.delete_message(chat_id=chat_id, message_id=msg_id)
-            except Exception as e:
-                logger.warning(f"Could not delete message {msg_id}: {e}")
+        active_tasks[user_id] = TaskHandle(task_type, task=asyncio.current_task())
+        ext = os.path.splitext(file_name)[1] or ".jpg"
+        cache_key = (file_id, ext.lower())
+        result = image_results.get(cache_key)
+        
+        if result is None:
+            # Images are small enough to stay in memory end to end
+            data = await download_telegram_bytes(context.bot, file_id)
+            # The same image re-uploaded (not forwarded) gets a new file_id; match it by content
+            digest = await asyncio.to_thread(lambda: hashlib.sha256(data).digest())
+            content_key = (digest, ext.lower())
+            result = image_results.get(content_key)
+        await collect_ack_message(ack_task, messages_to_delete)
+        
+        if result is None:
+            result = await run_in_pool(blur_faces_in_image_bytes, data, ext)
+            if result is not None:
+                image_results.put(content_key, result)
+        
+        # The in-memory result itself is the success signal; there is no output file to stat
+        if result is not None:
+            image_results.put(cache_key, result)
+            result_msg = await send_result_bytes(
+                context.bot, chat_id, result,
+                filename=f"blurred_{file_name}",
+                caption=f"✅ **Done!**\n⚠️ **SAVE NOW!** Auto-deleting in {AUTO_DELETE_SECONDS}s..."
+            )
+            # The caption carries the auto-delete warning; no separate message
+            messages_to_delete.append(result_msg.message_id)
+            
+            set_cooldown(user_id)
+        else:
+            await context.bot.send_message(chat_id=chat_id, text="❌ Failed to process image.")
     except Exception as e:
-        logger.error(f"Error in delete_messages_after_delay: {e}")
+        logger.error(f"Error processing image: {e}")
+        await context.bot.send_message(chat_id=chat_id, text=f"❌ An error occurred: {e}")
+    finally:
+        if user_id in active_tasks:
+            del active_tasks[user_id]
+        # Success, failure or cancel: the processing message is always cleaned up
+        await collect_ack_message(ack_task, messages_to_delete)
+        schedule_message_deletion(context, chat_id, messages_to_delete, AUTO_DELETE_SECONDS)
+        from handlers.queue_worker import trigger_next_queued_job
+        run_in_background(trigger_next_queued_job(context))
 
 
 @require_auth
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, queued_data: dict = None):
-    """Handle photo uploads."""
+    """Handle photo uploads and images sent as documents."""
     if queued_data:
         user_id = queued_data["user_id"]
         chat_id = queued_data["chat_id"]
@@ -69,22 +108,35 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, queue
         user_id = user.id
         chat_id = update.effective_chat.id
     
-    messages_to_delete = []
-    user_mode_data = get_user_mode(user_id)
+    user_mode_data = get_user_settings(user_id)
     
     # Skip checks if this is an auto-triggered queued task
     if not queued_data:
         # Auth check handled by decorator
+        photo_obj = update.message.photo[-1] if update.message.photo else update.message.document
+        if not photo_obj: return
+        is_document = not update.message.photo
+        file_size_mb = photo_obj.file_size / (1024 * 1024)
+        
+        # Reject from the message metadata before queueing or downloading anything
+        # (documents carry no dimensions; blur_faces_in_image_bytes bounds them by MAX_IMAGE_PIXELS)
+        if getattr(photo_obj, 'width', 0) > MAX_IMAGE_DIMENSION or getattr(photo_obj, 'height', 0) > MAX_IMAGE_DIMENSION:
+            await update.message.reply_text("❌ Image resolution too high!")
+            return
+        
+        if file_size_mb > MAX_IMAGE_SIZE_MB:
+            await update.message.reply_text(f"❌ Image too large ({file_size_mb:.1f} MB)!")
+            return
         
         if is_on_cooldown(user_id):
             remaining = get_cooldown_remaining(user_id)
             await update.message.reply_text(
                 f"⏳ **Please wait {remaining} seconds**\n\nYou can send another file after the cooldown.",
-                parse_mode='Markdown'
+                parse_mode=ParseMode.MARKDOWN
             )
             return
             
-        if user_mode_data["mode"] == "voice":
+        if user_mode_data.mode == "voice":
             await update.message.reply_text("❌ **Voice mode only works with videos!**")
             return
             
@@ -93,23 +145,24 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, queue
             return
             
         if is_server_busy():
-            photo_obj = update.message.photo[-1]
             file_id = photo_obj.file_id
-            file_size_mb = photo_obj.file_size / (1024 * 1024)
+            file_type = "document_photo" if is_document else "photo"
             metadata = {"mode": "face"}
-            position = add_to_queue(user_id, chat_id, file_size_mb, file_id, "photo", metadata)
+            if is_document:
+                metadata["file_name"] = photo_obj.file_name
+            position = add_to_queue(user_id, chat_id, file_size_mb, file_id, file_type, metadata)
             wait_time = format_wait_time(estimate_wait_time(position, file_size_mb))
             
             queue_msg = await update.message.reply_text(
                 f"⏳ **Server Busy - You are #{position} in Queue**\n"
                 f"⏱️ Est. Wait: {wait_time}\n\n"
                 f"✅ **Auto-Upload Active**\n"
-                f"Your photo is saved. It will start automatically when it's your turn.\n"
+                f"Your {'file' if is_document else 'photo'} is saved. It will start automatically when it's your turn.\n"
                 f"**You do NOT need to re-upload.**\n\n"
                 f"❌ Use /stop to leave the queue.",
-                parse_mode='Markdown'
+                parse_mode=ParseMode.MARKDOWN
             )
-            add_to_queue(user_id, chat_id, file_size_mb, file_id, "photo", metadata, queue_msg.message_id)
+            add_to_queue(user_id, chat_id, file_size_mb, file_id, file_type, metadata, queue_msg.message_id)
             return
     
     remove_from_queue(user_id)
@@ -117,77 +170,27 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, queue
     if queued_data:
         file_id = queued_data["file_id"]
         file_size_mb = queued_data["file_size_mb"]
-        file_name = "queued_photo.jpg"
+        is_document = queued_data["file_type"] == "document_photo"
+        file_name = queued_data["metadata"].get("file_name") or ("image.jpg" if is_document else "queued_photo.jpg")
         photo_obj = None
     else:
-        photo_obj = update.message.photo[-1]
         file_id = photo_obj.file_id
-        file_size_mb = photo_obj.file_size / (1024 * 1024)
-        file_name = "photo.jpg"
-
-    if not queued_data and (photo_obj.width > MAX_IMAGE_DIMENSION or photo_obj.height > MAX_IMAGE_DIMENSION):
-        await update.message.reply_text("❌ Image resolution too high!")
-        return
+        file_name = (photo_obj.file_name or "image.jpg") if is_document else "photo.jpg"
     
-    if file_size_mb > MAX_IMAGE_SIZE_MB:
-        msg = f"❌ Image too large ({file_size_mb:.1f} MB)!"
-        if queued_data:
-            await context.bot.send_message(chat_id=chat_id, text=msg)
-        else:
-            await update.message.reply_text(msg)
-        return
-    
-    estimated_time = max(int(file_size_mb * ESTIMATE_IMAGE_SEC_PER_MB), 2)
-    res_str = f"{photo_obj.width}x{photo_obj.height}" if photo_obj else "Saved Resolution"
-    
-    processing_msg = await context.bot.send_message(
-        chat_id=chat_id,
-        text=f"⏳ **Processing your image...**\n\n📐 Resolution: {res_str}\n⏱️ Estimated time: ~{estimated_time}s",
-        parse_mode='Markdown'
-    )
-    messages_to_delete.append(processing_msg.message_id)
+    if is_document:
+        processing_text = "⏳ **Processing image from document...**"
+    else:
+        estimated_time = max(int(file_size_mb * ESTIMATE_IMAGE_SEC_PER_MB), 2)
+        res_str = f"{photo_obj.width}x{photo_obj.height}" if photo_obj else "Saved Resolution"
+        processing_text = f"⏳ **Processing your image...**\n\n📐 Resolution: {res_str}\n⏱️ Estimated time: ~{estimated_time}s"
+    task_type = "document" if is_document else "photo"
     
-    try:
-        active_tasks[user_id] = {"type": "photo"}
-        with tempfile.TemporaryDirectory() as temp_dir:
-            input_path = os.path.join(temp_dir, "input.jpg")
-            output_path = os.path.join(temp_dir, "output.jpg")
-            file = await context.bot.get_file(file_id)
-            await file.download_to_drive(input_path)
-            
-            success = await asyncio.to_thread(blur_faces_in_image, input_path, output_path)
-            
-            if success and os.path.exists(output_path):
-                with open(output_path, 'rb') as f:
-                    image_data = f.read()
-                
-                result_msg = await context.bot.send_document(
-                    chat_id=chat_id,
-                    document=BytesIO(image_data),
-                    filename=f"blurred_{file_name}",
-                    caption=f"✅ **Done!**\n⚠️ **SAVE NOW!** Auto-deleting in {AUTO_DELETE_SECONDS}s..."
-                )
-                messages_to_delete.append(result_msg.message_id)
-                
-                warning_msg = await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=f"🗑️ **Auto-delete in {AUTO_DELETE_SECONDS}s!**",
-                    parse_mode='Markdown'
-                )
-                messages_to_delete.append(warning_msg.message_id)
-                
-                set_cooldown(user_id)
-                asyncio.create_task(delete_messages_after_delay(context, chat_id, messages_to_delete, AUTO_DELETE_SECONDS))
-            else:
-                await context.bot.send_message(chat_id=chat_id, text="❌ Failed to process image.")
-    except Exception as e:
-        logger.error(f"Error processing photo: {e}")
-        await context.bot.send_message(chat_id=chat_id, text=f"❌ An error occurred: {e}")
-    finally:
-        if user_id in active_tasks:
-            del active_tasks[user_id]
-        from handlers.queue_worker import trigger_next_queued_job
-        asyncio.create_task(trigger_next_queued_job(context))
+    # The job runs as its own task so the update handler returns right after starting it
+    start_job(user_id, task_type, _process_image(context, chat_id, user_id, file_id, file_name, processing_text, task_type))
+
+
+# First MIME segment -> queued file type for document uploads
+DOCUMENT_FILE_TYPES = {"video": "document_video", "image": "document_photo"}
 
 
 @require_auth
@@ -196,96 +199,23 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE, qu
     from handlers.video import handle_video
     
     if queued_data:
-        user_id = queued_data["user_id"]
-        chat_id = queued_data["chat_id"]
         file_type = queued_data["file_type"]
     else:
-        user = update.effective_user
-        user_id = user.id
-        chat_id = update.effective_chat.id
         document = update.message.document
         if not document or not document.mime_type:
             await update.message.reply_text("❌ Unsupported file type.")
             return
-        mime_type = document.mime_type.lower()
-        file_type = "document_video" if mime_type.startswith('video/') else ("document_photo" if mime_type.startswith('image/') else "unknown")
-
-    if file_type == "document_video":
-        await handle_video(update, context, queued_data=queued_data)
-    elif file_type == "document_photo":
-        # Check busy for documents
-        if not queued_data and is_server_busy():
-            document = update.message.document
-            file_id = document.file_id
-            file_size_mb = document.file_size / (1024 * 1024)
-            metadata = {"mode": "face", "file_name": document.file_name}
-            position = add_to_queue(user_id, chat_id, file_size_mb, file_id, "document_photo", metadata)
-            wait_time = format_wait_time(estimate_wait_time(position, file_size_mb))
-            queue_msg = await update.message.reply_text(
-                f"⏳ **Server Busy - You are #{position} in Queue**\n"
-                f"⏱️ Est. Wait: {wait_time}\n"
-                f"✅ **Auto-Upload Active**\n"
-                f"Your file is saved. It will start automatically when it's your turn.\n"
-                f"**You do NOT need to re-upload.**\n\n"
-                f"❌ Use /stop to leave the queue.",
-                parse_mode='Markdown'
-            )
-            add_to_queue(user_id, chat_id, file_size_mb, file_id, "document_photo", metadata, queue_msg.message_id)
-            return
-
-        # Core document processing (similar to handle_photo)
-        messages_to_delete = []
-        if queued_data:
-            file_id = queued_data["file_id"]
-            file_size_mb = queued_data["file_size_mb"]
-            file_name = queued_data["metadata"].get("file_name", "image.jpg")
-        else:
-            document = update.message.document
-            file_id = document.file_id
-            file_size_mb = document.file_size / (1024 * 1024)
-            file_name = document.file_name or "image.jpg"
-
-        processing_msg = await context.bot.send_message(chat_id=chat_id, text="⏳ **Processing image from document...**")
-        messages_to_delete.append(processing_msg.message_id)
+        kind = document.mime_type.split('/', 1)[0].lower()
+        file_type = DOCUMENT_FILE_TYPES.get(kind)
 
-        try:
-            active_tasks[user_id] = {"type": "document"}
-            with tempfile.TemporaryDirectory() as temp_dir:
-                ext = os.path.splitext(file_name)[1] or ".jpg"
-                input_path = os.path.join(temp_dir, f"input{ext}")
-                output_path = os.path.join(temp_dir, f"output{ext}")
-                file = await context.bot.get_file(file_id)
-                await file.download_to_drive(input_path)
-                
-                success = await asyncio.to_thread(blur_faces_in_image, input_path, output_path)
-                
-                if success and os.path.exists(output_path):
-                    with open(output_path, 'rb') as f:
-                        image_data = f.read()
-                    
-                    result_msg = await context.bot.send_document(
-                        chat_id=chat_id,
-                        document=BytesIO(image_data),
-                        filename=f"blurred_{file_name}",
-                        caption=f"✅ **Done!**\n⚠️ **SAVE NOW!** Auto-deleting in {AUTO_DELETE_SECONDS}s..."
-                    )
-                    messages_to_delete.append(result_msg.message_id)
-                    set_cooldown(user_id)
-                    asyncio.create_task(delete_messages_after_delay(context, chat_id, messages_to_delete, AUTO_DELETE_SECONDS))
-                else:
-                    await context.bot.send_message(chat_id=chat_id, text="❌ Failed to process document.")
-        except Exception as e:
-            logger.error(f"Error: {e}")
-            await context.bot.send_message(chat_id=chat_id, text=f"❌ Error: {e}")
-        finally:
-            if user_id in active_tasks:
-                del active_tasks[user_id]
-            from handlers.queue_worker import trigger_next_queued_job
-            asyncio.create_task(trigger_next_queued_job(context))
+    dispatch = {"document_video": handle_video, "document_photo": handle_photo}.get(file_type)
+    if dispatch:
+        await dispatch(update, context, queued_data=queued_data)
     else:
         await update.message.reply_text("❌ Unsupported file type.")
 
 
+@rate_limit
 @require_auth
 async def handle_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle unknown messages."""
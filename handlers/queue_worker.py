@@ -5,7 +5,7 @@ Handles automatic processing of queued files.
 
 import asyncio
 from telegram.ext import ContextTypes
-from utils.queue_manager import notify_next_in_queue, remove_from_queue
+from utils.queue_manager import notify_next_in_queue, remove_from_queue, is_shutting_down
 from config import logger
 
 
@@ -13,6 +13,9 @@ async def trigger_next_queued_job(context: ContextTypes.DEFAULT_TYPE):
     """
     Check if a slot is available and start processing the next user in queue.
     """
+    if is_shutting_down():
+        return
+    
     # Notify next user and get their data
     next_user = await notify_next_in_queue(context)
     
@@ -1,6 +1,8 @@
 import os
 import uuid
+import asyncio
 from datetime import datetime
+from pathlib import Path
 from telegram import Update
 from telegram.ext import (
     ContextTypes,
@@ -9,22 +11,36 @@ from telegram.ext import (
     MessageHandler,
     filters,
 )
+from telegram.constants import ParseMode
 from config import logger
 
 # States
 REPORT_CAPTION, REPORT_IMAGES = range(2)
 
+REPORT_INTRO_MESSAGE = (
+    "📝 *New Bug Report*\n\n"
+    "Please briefly describe the bug or issue you encountered.\n"
+    "This explanation will be saved as the caption for your report.\n\n"
+    "Send /cancel to abort at any time."
+)
+REPORT_IMAGES_PROMPT = (
+    "✅ Caption saved.\n\n"
+    "Now, you can upload up to **5 screenshots/images** related to the issue.\n\n"
+    "• Send images one by one or as an album.\n"
+    "• If you don't have images, just send /done.\n"
+    "• When finished uploading, send /done."
+)
+REPORT_LIMIT_MESSAGE = (
+    "⚠️ **Limit Reached**\n\n"
+    "You have already uploaded 5 images. We will only keep these 5.\n"
+    "Please send /done to submit your report."
+)
+
 async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the report conversation."""
     logger.info(f"User {update.effective_user.username} started a report.")
     
-    await update.message.reply_text(
-        "📝 *New Bug Report*\n\n"
-        "Please briefly describe the bug or issue you encountered.\n"
-        "This explanation will be saved as the caption for your report.\n\n"
-        "Send /cancel to abort at any time.",
-        parse_mode="Markdown"
-    )
+    await update.message.reply_text(REPORT_INTRO_MESSAGE, parse_mode=ParseMode.MARKDOWN)
     return REPORT_CAPTION
 
 async def report_caption(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -32,45 +48,40 @@ async def report_caption(update: Update, context: ContextTypes.DEFAULT_TYPE):
     caption = update.message.text
     context.user_data['report_caption'] = caption
     context.user_data['report_images'] = []
+    context.user_data['report_image_uids'] = set()
     
-    await update.message.reply_text(
-        "✅ Caption saved.\n\n"
-        "Now, you can upload up to **5 screenshots/images** related to the issue.\n\n"
-        "• Send images one by one or as an album.\n"
-        "• If you don't have images, just send /done.\n"
-        "• When finished uploading, send /done.",
-        parse_mode="Markdown"
-    )
+    await update.message.reply_text(REPORT_IMAGES_PROMPT, parse_mode=ParseMode.MARKDOWN)
     return REPORT_IMAGES
 
 async def report_images(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle image uploads."""
-    current_images = context.user_data.get('report_images', [])
+    # Appended in place; report_caption starts each report with a fresh list
+    current_images = context.user_data.setdefault('report_images', [])
+    count = len(current_images)
     
     # If user sends text instead of /done or images (and it's not a command because filters handled it? No wait context filter handles text/video)
     # The handler config uses filters.PHOTO. 
     # If we want to catch user mistakes (sending text in image state), we might need a fallback or broad filter.
     # But let's stick to the happy path + command fallback.
     
-    if len(current_images) >= 5:
-        await update.message.reply_text(
-            "⚠️ **Limit Reached**\n\n"
-            "You have already uploaded 5 images. We will only keep these 5.\n"
-            "Please send /done to submit your report.",
-            parse_mode="Markdown"
-        )
+    if count >= 5:
+        await update.message.reply_text(REPORT_LIMIT_MESSAGE, parse_mode=ParseMode.MARKDOWN)
         return REPORT_IMAGES
 
     # Get the file_id of the largest photo
     photo = update.message.photo[-1]
     file_id = photo.file_id
     
-    # Avoid duplicates if user sends same image? Tricky to distinct without hash. 
-    # Just append.
-    current_images.append(file_id)
-    context.user_data['report_images'] = current_images
+    # file_unique_id is the same for every copy of a photo (forwards, re-sends),
+    # so duplicates are skipped without downloading anything
+    seen = context.user_data.setdefault('report_image_uids', set())
+    if photo.file_unique_id in seen:
+        await update.message.reply_text("♻️ You already sent this image, skipping it.")
+        return REPORT_IMAGES
+    seen.add(photo.file_unique_id)
     
-    count = len(current_images)
+    current_images.append(file_id)
+    count += 1
     
     msg = f"📸 Image {count}/5 received."
     if count >= 5:
@@ -79,6 +90,36 @@ async def report_images(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(msg)
     return REPORT_IMAGES
 
+async def _save_evidence(bot, report_dir: str, index: int, file_id: str):
+    """Download one report image into the report folder."""
+    file = await bot.get_file(file_id)
+    # Determine extension (default to jpg if unknown, but usually we can infer or it doesn't matter much for display)
+    # file.file_path might have extension
+    ext = ".jpg"
+    if file.file_path:
+        _, ext_web = os.path.splitext(file.file_path)
+        if ext_web:
+            ext = ext_web
+    
+    save_path = os.path.join(report_dir, f"evidence_{index+1}{ext}")
+    # download_to_drive would write the file on the event loop
+    data = await file.download_as_bytearray()
+    await asyncio.to_thread(Path(save_path).write_bytes, data)
+
+def _write_report_info(report_dir: str, report_uuid: str, timestamp: str, username: str, user_id: int, caption: str, image_count: int):
+    """Create the report folder and its info file (blocking, run in a thread)."""
+    os.makedirs(report_dir, exist_ok=True)
+    info_path = os.path.join(report_dir, "report_info.txt")
+    with open(info_path, "w", encoding="utf-8") as f:
+        f.write(f"Report ID: {report_uuid}\n")
+        f.write(f"Timestamp: {timestamp}\n")
+        f.write(f"User: {username} (ID: {user_id})\n")
+        f.write("-" * 30 + "\n")
+        f.write("CAPTION:\n")
+        f.write(caption + "\n")
+        f.write("-" * 30 + "\n")
+        f.write(f"Images count: {image_count}\n")
+
 async def report_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Save the report."""
     user = update.effective_user
@@ -93,43 +134,28 @@ async def report_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Base directory
     base_dir = "reports"
     report_dir = os.path.join(base_dir, folder_name)
-    os.makedirs(report_dir, exist_ok=True)
     
     caption = context.user_data.get('report_caption', "No caption provided")
     image_file_ids = context.user_data.get('report_images', [])
     
-    # Save Report Info
-    info_path = os.path.join(report_dir, "report_info.txt")
-    with open(info_path, "w", encoding="utf-8") as f:
-        f.write(f"Report ID: {report_uuid}\n")
-        f.write(f"Timestamp: {timestamp}\n")
-        f.write(f"User: {username} (ID: {user_id})\n")
-        f.write("-" * 30 + "\n")
-        f.write("CAPTION:\n")
-        f.write(caption + "\n")
-        f.write("-" * 30 + "\n")
-        f.write(f"Images count: {len(image_file_ids)}\n")
+    # Save Report Info (off the event loop, like the image writes)
+    await asyncio.to_thread(
+        _write_report_info, report_dir, report_uuid, timestamp, username, user_id, caption, len(image_file_ids)
+    )
     
     await update.message.reply_text("💾 Saving your report (this might take a moment if you sent images)...")
     
-    # Download images
+    # Download images (independent transfers, so all at once)
+    results = await asyncio.gather(
+        *(_save_evidence(context.bot, report_dir, i, file_id) for i, file_id in enumerate(image_file_ids)),
+        return_exceptions=True
+    )
     saved_count = 0
-    for i, file_id in enumerate(image_file_ids):
-        try:
-            file = await context.bot.get_file(file_id)
-            # Determine extension (default to jpg if unknown, but usually we can infer or it doesn't matter much for display)
-            # file.file_path might have extension
-            ext = ".jpg"
-            if file.file_path:
-                _, ext_web = os.path.splitext(file.file_path)
-                if ext_web:
-                    ext = ext_web
-            
-            save_path = os.path.join(report_dir, f"evidence_{i+1}{ext}")
-            await file.download_to_drive(save_path)
+    for i, result in enumerate(results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to download image {i} for report {report_uuid}: {result}")
+        else:
             saved_count += 1
-        except Exception as e:
-            logger.error(f"Failed to download image {i} for report {report_uuid}: {e}")
             
     logger.info(f"Report {report_uuid} saved by {username} with {saved_count} images.")
     
@@ -137,7 +163,7 @@ async def report_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "✅ **Report Submitted Successfully!**\n\n"
         f"Reference ID: `{report_uuid}`\n"
         "Thank you for helping us improve.",
-        parse_mode="Markdown"
+        parse_mode=ParseMode.MARKDOWN
     )
     
     context.user_data.clear()
@@ -1,3 +1,5 @@
+import asyncio
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     ContextTypes,
@@ -7,8 +9,9 @@ from telegram.ext import (
     CallbackQueryHandler,
     filters,
 )
-from config import OWNER_ID, logger
-from utils.auth import is_user_allowed, save_authorized_ids, load_authorized_ids
+from telegram.constants import ParseMode
+from config import OWNER_ID, ACCESS_REQUEST_TIMEOUT_SECONDS, logger
+from utils.auth import add_authorized_user
 from utils.access_manager import (
     add_request,
     get_request_status,
@@ -21,6 +24,37 @@ from utils.access_manager import (
 # Conversation States
 WAITING_NOTE = 1
 
+REQUEST_PENDING_MESSAGE = (
+    "⏳ **Request Under Review**\n\n"
+    "You already have a pending request.\n"
+    "Please wait for the administrator."
+)
+REQUEST_NOTE_PROMPT = (
+    "📝 **Request Access**\n\n"
+    "Please reply to this message with a **brief note** introducing yourself.\n"
+    "The owner will review your request."
+)
+REQUEST_SENT_MESSAGE = (
+    "✅ **Request Sent**\n\n"
+    "Your request has been forwarded to the administrator.\n"
+    "You will be notified here if approved."
+)
+ACCESS_GRANTED_MESSAGE = (
+    "🎉 **Access Granted!**\n\n"
+    "Your request has been approved.\n"
+    "Send /start to begin."
+)
+
+APPROVE_LABEL = "✅ Approve"
+DENY_LABEL = "❌ Deny"
+
+def _make_approval_markup(user_id: int) -> InlineKeyboardMarkup:
+    """Owner's Approve/Deny buttons for a user's access request."""
+    return InlineKeyboardMarkup.from_row([
+        InlineKeyboardButton(APPROVE_LABEL, callback_data=f"admin_approve_{user_id}"),
+        InlineKeyboardButton(DENY_LABEL, callback_data=f"admin_deny_{user_id}")
+    ])
+
 async def start_request_flow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Triggered when user clicks 'Request Access'.
@@ -30,22 +64,12 @@ async def start_request_flow(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Double check if already pending (just in case)
     user_id = query.from_user.id
-    status = get_request_status(user_id)
+    status = await asyncio.to_thread(get_request_status, user_id)
     if status in [STATUS_PENDING, STATUS_IGNORED]:
-        await query.edit_message_text(
-            "⏳ **Request Under Review**\n\n"
-            "You already have a pending request.\n"
-            "Please wait for the administrator.",
-            parse_mode="Markdown"
-        )
+        await query.edit_message_text(REQUEST_PENDING_MESSAGE, parse_mode=ParseMode.MARKDOWN)
         return ConversationHandler.END
 
-    await query.edit_message_text(
-        "📝 **Request Access**\n\n"
-        "Please reply to this message with a **brief note** introducing yourself.\n"
-        "The owner will review your request.",
-        parse_mode="Markdown"
-    )
+    await query.edit_message_text(REQUEST_NOTE_PROMPT, parse_mode=ParseMode.MARKDOWN)
     return WAITING_NOTE
 
 async def receive_note(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -54,42 +78,33 @@ async def receive_note(update: Update, context: ContextTypes.DEFAULT_TYPE):
     note = update.message.text
     
     # Save Request
-    add_request(user.id, user.first_name, user.username, note)
+    await asyncio.to_thread(add_request, user.id, user.first_name, user.username, note)
     
-    # Notify Admin
+    # Notify Admin and confirm to the user concurrently
+    sends = [
+        update.message.reply_text(REQUEST_SENT_MESSAGE, parse_mode=ParseMode.MARKDOWN)
+    ]
     if OWNER_ID != 0:
-        keyboard = [
-            [
-                InlineKeyboardButton("✅ Approve", callback_data=f"admin_approve_{user.id}"),
-                InlineKeyboardButton("❌ Deny", callback_data=f"admin_deny_{user.id}")
-            ]
-        ]
+        full_name = " ".join(p for p in (user.first_name, user.last_name) if p)
+        user_display = f"{full_name} (@{user.username})" if user.username else full_name
         
-        user_display = f"{user.first_name}"
-        if user.last_name: user_display += f" {user.last_name}"
-        if user.username: user_display += f" (@{user.username})"
-            
-        try:
-            await context.bot.send_message(
-                chat_id=OWNER_ID,
-                text=(
-                    f"🔔 **New Access Request**\n\n"
-                    f"👤 **User:** {user_display}\n"
-                    f"🆔 **ID:** `{user.id}`\n\n"
-                    f"📝 **Note:**\n_{note}_"
-                ),
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify owner: {e}")
+        sends.append(context.bot.send_message(
+            chat_id=OWNER_ID,
+            text=(
+                f"🔔 **New Access Request**\n\n"
+                f"👤 **User:** {user_display}\n"
+                f"🆔 **ID:** `{user.id}`\n\n"
+                f"📝 **Note:**\n_{note}_"
+            ),
+            reply_markup=_make_approval_markup(user.id),
+            parse_mode=ParseMode.MARKDOWN
+        ))
     
-    await update.message.reply_text(
-        "✅ **Request Sent**\n\n"
-        "Your request has been forwarded to the administrator.\n"
-        "You will be notified here if approved.",
-        parse_mode="Markdown"
-    )
+    results = await asyncio.gather(*sends, return_exceptions=True)
+    if isinstance(results[0], Exception):
+        logger.error(f"Failed to confirm request to user {user.id}: {results[0]}")
+    if len(results) > 1 and isinstance(results[1], Exception):
+        logger.error(f"Failed to notify owner: {results[1]}")
     return ConversationHandler.END
 
 async def cancel_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -105,6 +120,8 @@ def get_request_handler():
             WAITING_NOTE: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_note)]
         },
         fallbacks=[CommandHandler("cancel", cancel_request)],
+        # Drop abandoned requests so unanswered prompts don't accumulate state
+        conversation_timeout=ACCESS_REQUEST_TIMEOUT_SECONDS,
     )
 
 async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -114,44 +131,38 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
     
     data = query.data
     # Format: admin_approve_123456 or admin_deny_123456
-    parts = data.split("_")
-    action = parts[1] # approve or deny
-    target_id = int(parts[2])
+    action, _, target = data[len("admin_"):].partition("_") # approve or deny
+    target_id = int(target)
     
     if action == "approve":
         # 1. Authorize
-        from utils.auth import add_authorized_user
-        add_authorized_user(target_id)
+        await asyncio.to_thread(add_authorized_user, target_id)
         
         # 2. Clean up request
-        remove_request(target_id)
+        await asyncio.to_thread(remove_request, target_id)
         
-        # 3. Notify User
-        try:
-            await context.bot.send_message(
-                target_id,
-                "🎉 **Access Granted!**\n\n"
-                "Your request has been approved.\n"
-                "Send /start to begin.",
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.warning(f"Could not notify user {target_id}: {e}")
-            
-        # 4. Update Admin Message
-        await query.edit_message_text(
-            f"{query.message.text_markdown}\n\n"
-            f"✅ **Approved**",
-            parse_mode="Markdown"
+        # 3. Notify User and 4. Update Admin Message concurrently
+        notify_result, edit_result = await asyncio.gather(
+            context.bot.send_message(target_id, ACCESS_GRANTED_MESSAGE, parse_mode=ParseMode.MARKDOWN),
+            query.edit_message_text(
+                f"{query.message.text_markdown}\n\n"
+                f"✅ **Approved**",
+                parse_mode=ParseMode.MARKDOWN
+            ),
+            return_exceptions=True
         )
+        if isinstance(notify_result, Exception):
+            logger.warning("Could not notify user %s: %s", target_id, notify_result)
+        if isinstance(edit_result, Exception):
+            logger.error("Could not update approval message for %s: %s", target_id, edit_result)
         
     elif action == "deny":
         # 1. Mark ignored
-        mark_ignored(target_id)
+        await asyncio.to_thread(mark_ignored, target_id)
         
         # 2. Update Admin Message
         await query.edit_message_text(
             f"{query.message.text_markdown}\n\n"
             f"❌ **Denied** (Silently)",
-            parse_mode="Markdown"
+            parse_mode=ParseMode.MARKDOWN
         )
@@ -1,10 +1,11 @@
 """Processors package initialization."""
 
-from processors.face_blur import blur_faces_in_image, blur_faces_in_video, download_model
+from processors.face_blur import blur_faces_in_image, blur_faces_in_image_bytes, blur_faces_in_video, download_model
 from processors.voice_anon import anonymize_voice_fast, anonymize_voice_secure
 
 __all__ = [
     'blur_faces_in_image',
+    'blur_faces_in_image_bytes',
     'blur_faces_in_video',
     'download_model',
     'anonymize_voice_fast',
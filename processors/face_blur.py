@@ -9,11 +9,38 @@ import os
 import urllib.request
 import subprocess
 import shutil
-import gc
-import time
+import tempfile
+import functools
+import queue
+import struct
+import threading
 
-from config import YUNET_MODEL, YUNET_URL, logger
-from utils.tracking import FaceTrack, FaceTracker
+from config import (
+    YUNET_MODEL,
+    YUNET_URL,
+    YUNET_BACKEND,
+    YUNET_INT8_MODEL,
+    YUNET_INT8_URL,
+    VIDEO_DETECT_EVERY_N_FRAMES,
+    VIDEO_DETECT_MAX_DIMENSION,
+    IMAGE_DETECT_MAX_DIMENSION,
+    MAX_IMAGE_PIXELS,
+    IMAGE_JPEG_QUALITY,
+    VIDEO_ENCODER,
+    VAAPI_DEVICE,
+    logger
+)
+from utils.tracking import FaceTracker, HAS_KCF
+from processors.yunet_ort import YuNetORT, ort
+
+try:
+    from turbojpeg import TurboJPEG
+    _turbojpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    # Not installed, or libturbojpeg itself is missing
+    _turbojpeg = None
+
+JPEG_EXTENSIONS = {".jpg", ".jpeg"}
 
 
 def download_model(model_name: str = YUNET_MODEL, url: str = YUNET_URL) -> bool:
@@ -33,7 +60,168 @@ def download_model(model_name: str = YUNET_MODEL, url: str = YUNET_URL) -> bool:
     return True
 
 
-def apply_elliptical_blur(image, bbox):
+def _create_detector(width: int, height: int):
+    """Load YuNet with the configured backend, falling back to OpenCV DNN."""
+    if YUNET_BACKEND == "onnxruntime":
+        if ort is None:
+            logger.warning("YUNET_BACKEND=onnxruntime but onnxruntime is not installed, using OpenCV")
+        elif download_model(YUNET_INT8_MODEL, YUNET_INT8_URL):
+            try:
+                return YuNetORT(YUNET_INT8_MODEL, (width, height), score_threshold=0.5, nms_threshold=0.3, top_k=5000)
+            except Exception as e:
+                logger.error(f"Failed to load int8 YuNet with onnxruntime, using OpenCV: {e}")
+    
+    if not download_model():
+        return None
+    try:
+        return cv2.FaceDetectorYN.create(
+            model=YUNET_MODEL,
+            config="",
+            input_size=(width, height),
+            score_threshold=0.5,
+            nms_threshold=0.3,
+            top_k=5000
+        )
+    except Exception as e:
+        logger.error(f"Failed to load YuNet: {e}")
+        return None
+
+
+# One YuNet detector per worker thread, reused across frames and requests
+_detector_local = threading.local()
+
+
+def get_detector(width: int, height: int):
+    """
+    Get this thread's cached YuNet detector, sized for width x height.
+    
+    Detectors are cached per thread because jobs run concurrently on
+    executor threads and a single OpenCV DNN net must not be shared.
+    Returns None if the model could not be loaded.
+    """
+    detector = getattr(_detector_local, "detector", None)
+    if detector is None:
+        detector = _create_detector(width, height)
+        if detector is None:
+            return None
+        _detector_local.detector = detector
+        _detector_local.input_size = (width, height)
+    elif _detector_local.input_size != (width, height):
+        detector.setInputSize((width, height))
+        _detector_local.input_size = (width, height)
+    return detector
+
+
+def _detection_size(width: int, height: int, max_dimension: int) -> tuple[int, int]:
+    """Size to run detection at: the frame shrunk so its longest side is at most max_dimension."""
+    scale = min(1.0, max_dimension / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+# H.264 encoders as (args before inputs, output video args), in order of preference
+_VIDEO_ENCODERS = {
+    'h264_nvenc': ([], ['-c:v', 'h264_nvenc', '-preset', 'p4', '-rc', 'vbr', '-cq', '23', '-pix_fmt', 'yuv420p']),
+    'h264_qsv': ([], ['-c:v', 'h264_qsv', '-global_quality', '23', '-pix_fmt', 'nv12']),
+    'h264_vaapi': (['-vaapi_device', VAAPI_DEVICE], ['-vf', 'format=nv12,hwupload', '-c:v', 'h264_vaapi', '-qp', '23']),
+    'h264_videotoolbox': ([], ['-c:v', 'h264_videotoolbox', '-q:v', '65', '-pix_fmt', 'yuv420p']),
+    'libx264': ([], ['-c:v', 'libx264', '-preset', 'fast', '-crf', '23', '-pix_fmt', 'yuv420p']),
+}
+
+
+def _encoder_works(name: str) -> bool:
+    """Check that ffmpeg can actually encode a tiny clip with this encoder."""
+    input_args, output_args = _VIDEO_ENCODERS[name]
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        *input_args,
+        '-f', 'lavfi', '-i', 'color=size=256x256:duration=0.1',
+        *output_args,
+        '-frames:v', '1', '-f', 'null', '-'
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=15)
+        return result.returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+@functools.lru_cache(maxsize=1)
+def get_video_encoder() -> str:
+    """Pick the H.264 encoder for the final ffmpeg pass (probed once per process)."""
+    if VIDEO_ENCODER != "auto":
+        if VIDEO_ENCODER in _VIDEO_ENCODERS:
+            return VIDEO_ENCODER
+        logger.warning(f"Unknown VIDEO_ENCODER {VIDEO_ENCODER!r}, using libx264")
+        return 'libx264'
+    
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True, timeout=15)
+        available = result.stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return 'libx264'
+    
+    for name in _VIDEO_ENCODERS:
+        if name == 'libx264':
+            break
+        if f" {name} " in available and _encoder_works(name):
+            logger.info(f"Using hardware video encoder: {name}")
+            return name
+    return 'libx264'
+
+
+# Frame buffers in flight between the decode, blur and encode stages
+_PIPELINE_FRAMES = 8
+
+# How long the blur loop waits for a decoded frame before re-checking for failures and cancellation
+_PIPELINE_POLL_SECONDS = 0.5
+
+# cancel_check may hit the filesystem (see processors.pool.CancelFlag), so poll it every few frames
+_CANCEL_CHECK_EVERY_N_FRAMES = 8
+
+
+# Blend masks are built once per ROI size rounded up to this many pixels and
+# cached (see _get_mask); each ROI uses the top-left slice of its bucket's mask
+_MASK_BUCKET = 8
+
+
+@functools.lru_cache(maxsize=256)
+def _get_mask(w8: int, h8: int) -> tuple[np.ndarray, np.ndarray]:
+    """Build the feathered elliptical blend weights (alpha, 1 - alpha) for a w8 x h8 ROI."""
+    mask = np.zeros((h8, w8), dtype=np.uint8)
+    center = (w8 // 2, h8 // 2)
+    axes = (w8 // 2, h8 // 2)
+    cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)
+    mask = cv2.GaussianBlur(mask, (21, 21), 0)
+    
+    alpha = mask.astype(np.float32) / 255.0
+    return alpha, 1.0 - alpha
+
+
+def _get_blend_weights(w: int, h: int) -> tuple[np.ndarray, np.ndarray]:
+    """Get blend weights for a w x h ROI, sliced from the mask for its 8px size bucket."""
+    w8 = -(-w // _MASK_BUCKET) * _MASK_BUCKET
+    h8 = -(-h // _MASK_BUCKET) * _MASK_BUCKET
+    alpha, inv_alpha = _get_mask(w8, h8)
+    return alpha[:h, :w], inv_alpha[:h, :w]
+
+
+class BlurBuffers:
+    """Scratch buffer reused by apply_elliptical_blur across faces and frames."""
+    
+    def __init__(self):
+        self.blurred = np.empty(0, dtype=np.uint8)
+    
+    def view(self, h, w):
+        """Return a contiguous h x w x 3 view of the blur buffer, growing it if needed."""
+        # Flat storage reshaped per ROI: cv2.stackBlur ignores the row stride of
+        # a sliced 2-D view and would write outside the ROI
+        size = h * w * 3
+        if size > self.blurred.size:
+            self.blurred = np.empty(size, dtype=np.uint8)
+        return self.blurred[:size].reshape(h, w, 3)
+
+
+def apply_elliptical_blur(image, bbox, buffers: BlurBuffers = None):
     """Apply elliptical blur to a region."""
     h_img, w_img = image.shape[:2]
     x, y, w, h = bbox
@@ -49,222 +237,446 @@ def apply_elliptical_blur(image, bbox):
     if new_w <= 0 or new_h <= 0:
         return
     
-    roi = image[y1:y2, x1:x2].copy()
+    if buffers is None:
+        buffers = BlurBuffers()
+    blurred_roi = buffers.view(new_h, new_w)
+    
+    image_roi = image[y1:y2, x1:x2]
     
     kw = (new_w // 3) | 1
     kh = (new_h // 3) | 1
     kw = max(kw, 15)
     kh = max(kh, 15)
     
-    try:
-        blurred_roi = cv2.GaussianBlur(roi, (kw, kh), 0)
-        
-        mask = np.zeros((new_h, new_w), dtype=np.uint8)
-        center = (new_w // 2, new_h // 2)
-        axes = (new_w // 2, new_h // 2)
-        cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)
-        
-        mask = cv2.GaussianBlur(mask, (21, 21), 0)
-        mask_3ch = cv2.merge([mask, mask, mask]).astype(float) / 255.0
+    # Stack blur looks like a Gaussian but its cost does not grow with the kernel size
+    cv2.stackBlur(image_roi, (kw, kh), dst=blurred_roi)
+    alpha, inv_alpha = _get_blend_weights(new_w, new_h)
+    
+    # Blend in place into the image, no ROI copy or float intermediates
+    cv2.blendLinear(blurred_roi, image_roi, alpha, inv_alpha, dst=image_roi)
+
+
+def _blur_faces(image) -> bool:
+    """Blur faces in a decoded BGR image in place. Returns False if no detector is available."""
+    height, width = image.shape[:2]
+    
+    # Detect on a downscaled copy of large images, blur at full resolution.
+    # The copy stays BGR: YuNet was trained on 3-channel input and rejects grayscale.
+    det_w, det_h = _detection_size(width, height, IMAGE_DETECT_MAX_DIMENSION)
+    if (det_w, det_h) != (width, height):
+        det_image = cv2.resize(image, (det_w, det_h), interpolation=cv2.INTER_AREA)
+    else:
+        det_image = image
+    det_to_image = np.array([width / det_w, height / det_h] * 2, dtype=np.float32)
+    
+    detector = get_detector(det_w, det_h)
+    if detector is None:
+        return False
+    
+    results = detector.detect(det_image)
+    
+    if results[1] is not None:
+        # Expand all face boxes by 60% at once, then blur one by one
+        faces = (results[1][:, :4] * det_to_image).astype(np.int64)
+        expand = (faces[:, 2:] * 0.3).astype(np.int64)
+        blur_bboxes = np.hstack([faces[:, :2] - expand, faces[:, 2:] + expand * 2])
         
-        blended = (blurred_roi * mask_3ch + roi * (1 - mask_3ch)).astype(np.uint8)
-        image[y1:y2, x1:x2] = blended
-    except:
-        pass
+        buffers = BlurBuffers()
+        for blur_bbox in blur_bboxes.tolist():
+            apply_elliptical_blur(image, blur_bbox, buffers)
+    return True
 
 
 def blur_faces_in_image(input_path: str, output_path: str) -> bool:
     """Blur faces in an image."""
-    if not download_model():
-        return False
-    
     try:
         image = cv2.imread(input_path)
         if image is None:
             return False
-        
-        height, width = image.shape[:2]
-        
-        detector = cv2.FaceDetectorYN.create(
-            model=YUNET_MODEL,
-            config="",
-            input_size=(width, height),
-            score_threshold=0.5,
-            nms_threshold=0.3,
-            top_k=5000
-        )
-        
-        results = detector.detect(image)
-        
-        if results[1] is not None:
-            for face in results[1]:
-                bbox = face[0:4].astype(int).tolist()
-                x, y, w, h = bbox
-                expand_ratio = 0.6
-                expand_w = int(w * expand_ratio / 2)
-                expand_h = int(h * expand_ratio / 2)
-                blur_bbox = [x - expand_w, y - expand_h, w + expand_w * 2, h + expand_h * 2]
-                apply_elliptical_blur(image, blur_bbox)
-        
-        cv2.imwrite(output_path, image)
-        return True
+        if not _blur_faces(image):
+            return False
+        # Success means the output file was written, so callers need not check for it
+        return cv2.imwrite(output_path, image)
     except Exception as e:
         logger.error(f"Error blurring image: {e}")
         return False
 
 
-def blur_faces_in_video(input_path: str, output_path: str, edge_crop_percent: int = 2, cancel_check=None) -> tuple[bool, bool]:
+def _encoded_image_size(data: bytes | bytearray) -> tuple[int, int] | None:
+    """Read (width, height) from a PNG or JPEG header without decoding; None if unknown."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:2] != b"\xff\xd8":
+        return None
+    # Walk the JPEG segments up to the frame header (SOFn, excluding DHT/JPG/DAC)
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            i += 2
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+    return None
+
+
+def _decode_image(data: bytes | bytearray):
+    """Decode an image to BGR, using libjpeg-turbo directly for plain JPEGs."""
+    # cv2 applies EXIF orientation and TurboJPEG does not, so EXIF JPEGs go through cv2
+    if _turbojpeg is not None and data[:3] == b"\xff\xd8\xff" and b"Exif\0\0" not in data[:4096]:
+        try:
+            return _turbojpeg.decode(data)
+        except OSError:
+            pass
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def _encode_image(image, ext: str) -> bytes | None:
+    """Encode a BGR image in the format given by ext."""
+    if ext in JPEG_EXTENSIONS:
+        if _turbojpeg is not None:
+            return _turbojpeg.encode(image, quality=IMAGE_JPEG_QUALITY)
+        # Optimized Huffman tables are lossless and shave a few more percent
+        ok, encoded = cv2.imencode(ext, image, [cv2.IMWRITE_JPEG_QUALITY, IMAGE_JPEG_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+        return encoded.tobytes() if ok else None
+    ok, encoded = cv2.imencode(ext, image)
+    return encoded.tobytes() if ok else None
+
+
+def blur_faces_in_image_bytes(data: bytes | bytearray, ext: str = ".jpg") -> bytes | None:
     """
-    Blur faces in a video with tracking.
+    Blur faces in an encoded image held in memory.
     
-    Args:
-        input_path: Path to input video
-        output_path: Path to output video
-        edge_crop_percent: Percentage to crop from edges
-        cancel_check: Optional callable that returns True if processing should be cancelled
+    Returns the blurred image re-encoded in the format given by ext,
+    or None on failure.
+    """
+    try:
+        # Bound memory and CPU before decoding (a small file can hold a huge image)
+        size = _encoded_image_size(data)
+        if size is not None and size[0] * size[1] > MAX_IMAGE_PIXELS:
+            logger.warning(f"Image too large to process: {size[0]}x{size[1]}")
+            return None
+        image = _decode_image(data)
+        if image is None:
+            return None
+        # Other formats are only measured once decoded
+        if image.shape[0] * image.shape[1] > MAX_IMAGE_PIXELS:
+            logger.warning(f"Image too large to process: {image.shape[1]}x{image.shape[0]}")
+            return None
+        
+        # Blurred and returned at full resolution; _blur_faces only detects on a downscaled copy
+        if not _blur_faces(image):
+            return None
+        return _encode_image(image, ext.lower())
+    except Exception as e:
+        logger.error(f"Error blurring image: {e}")
+        return None
+
+
+def _start_ffmpeg_encoder(input_path: str, output_path: str, frame_size: tuple[int, int], fps: float, encoder: str):
+    """
+    Start ffmpeg reading raw BGR frames from stdin.
+    Encodes H.264 once and muxes the original audio in the same pass.
     
     Returns:
-        (success, was_cancelled) tuple
+        (process, stderr_file) tuple
     """
-    if not download_model():
-        return False, False
-    
+    width, height = frame_size
+    encoder_input_args, encoder_output_args = _VIDEO_ENCODERS[encoder]
+    cmd = [
+        'ffmpeg', '-y',
+        '-loglevel', 'error',
+        *encoder_input_args,
+        '-f', 'rawvideo',
+        '-pix_fmt', 'bgr24',
+        '-s', f'{width}x{height}',
+        '-framerate', str(fps),
+        '-i', 'pipe:0',
+        '-i', input_path,
+        *encoder_output_args,
+        '-c:a', 'aac',
+        '-b:a', '128k',
+        '-map', '0:v:0',
+        '-map', '1:a:0?',
+        '-map_metadata', '-1',
+        '-map_chapters', '-1',
+        '-fflags', '+bitexact',
+        '-movflags', '+faststart',
+        '-shortest',
+        output_path
+    ]
+    # stderr goes to a file so a chatty ffmpeg can never block on a full pipe
+    stderr_file = tempfile.TemporaryFile()
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr_file)
+    return process, stderr_file
+
+
+def _decode_frames(cap, frames: list, free_q: queue.Queue, decoded_q: queue.Queue, stop_event: threading.Event):
+    """Pipeline stage 1: decode frames into free ring buffers."""
     try:
-        detector = cv2.FaceDetectorYN.create(
-            model=YUNET_MODEL,
-            config="",
-            input_size=(320, 320),
-            score_threshold=0.5,
-            nms_threshold=0.3,
-            top_k=5000
-        )
-    except Exception as e:
-        logger.error(f"Failed to load YuNet: {e}")
-        return False, False
+        while not stop_event.is_set():
+            try:
+                idx = free_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if not cap.grab():
+                break
+            success, frame = cap.retrieve(frames[idx])
+            if not success:
+                break
+            frames[idx] = frame
+            decoded_q.put(idx)
+    finally:
+        decoded_q.put(None)
 
+
+def _write_frames(frames: list, blurred_q: queue.Queue, free_q: queue.Queue, crop: tuple, out_buf, write_frame, write_failed: threading.Event):
+    """Pipeline stage 3: crop blurred frames and hand them to the encoder."""
+    while True:
+        idx = blurred_q.get()
+        if idx is None:
+            return
+        if not write_failed.is_set():
+            try:
+                np.copyto(out_buf, frames[idx][crop])
+                write_frame(out_buf)
+            except Exception as e:
+                # Any failure ends the job; buffers keep cycling so the other stages never block
+                logger.error(f"Error writing video frame: {e}")
+                write_failed.set()
+        free_q.put(idx)
+
+
+class _EncoderFailed(Exception):
+    """ffmpeg could not encode the output with the chosen encoder."""
+
+
+# Encoders that failed on a real video in this worker; later jobs skip them
+_failed_encoders: set = set()
+
+
+def _blur_video(input_path: str, output_path: str, edge_crop_percent: int, cancel_check, encoder: str | None) -> tuple[bool, bool]:
+    """
+    One blur pass for blur_faces_in_video, encoding with the given ffmpeg
+    encoder, or with OpenCV's VideoWriter if encoder is None.
+    
+    Raises _EncoderFailed (after removing the partial output) if ffmpeg fails.
+    """
     cap = cv2.VideoCapture(input_path)
     if not cap.isOpened():
         return False, False
 
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     
     crop_x = int(width * edge_crop_percent / 100)
     crop_y = int(height * edge_crop_percent / 100)
-    cropped_width = width - (2 * crop_x)
-    cropped_height = height - (2 * crop_y)
+    # Even dimensions: yuv420p/nv12 output rejects odd widths and heights
+    cropped_width = (width - (2 * crop_x)) & ~1
+    cropped_height = (height - (2 * crop_y)) & ~1
     
     if cropped_width <= 0 or cropped_height <= 0:
         cap.release()
         return False, False
     
-    temp_output = output_path + ".temp.mp4"
+    # Detection runs on a downscaled copy; boxes are scaled back to full frame
+    det_w, det_h = _detection_size(width, height, VIDEO_DETECT_MAX_DIMENSION)
+    det_to_frame = np.array([width / det_w, height / det_h] * 2, dtype=np.float32)
+    det_buf = np.empty((det_h, det_w, 3), dtype=np.uint8) if (det_w, det_h) != (width, height) else None
+    
+    # Input size is fixed for the whole video, so it is set once here
+    detector = get_detector(det_w, det_h)
+    if detector is None:
+        cap.release()
+        return False, False
     
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(temp_output, fourcc, fps, (cropped_width, cropped_height))
+    ffmpeg_proc = None
+    out = None
+    if encoder is not None:
+        try:
+            ffmpeg_proc, ffmpeg_stderr = _start_ffmpeg_encoder(input_path, output_path, (cropped_width, cropped_height), fps, encoder)
+        except OSError as e:
+            cap.release()
+            raise _EncoderFailed(str(e))
+    else:
+        # Without a working ffmpeg OpenCV writes the final file, so prefer H.264 when its build has it
+        for codec in ('avc1', 'mp4v'):
+            out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*codec), fps, (cropped_width, cropped_height))
+            if out.isOpened():
+                break
+            out.release()
+        else:
+            logger.error("Could not open a video writer")
+            cap.release()
+            return False, False
     
     face_tracker = FaceTracker()
-    FaceTrack._next_id = 0
+    # Skipped frames are only safe when KCF can follow faces between detections;
+    # otherwise boxes would stay put while a face moves out from under the blur
+    detect_every = VIDEO_DETECT_EVERY_N_FRAMES if HAS_KCF else 1
+    
+    # Decode, blur and encode overlap: a ring of frame buffers cycles through
+    # decode thread -> this thread -> writer thread and back
+    frames = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(_PIPELINE_FRAMES)]
+    out_buf = np.empty((cropped_height, cropped_width, 3), dtype=np.uint8)
+    crop = (slice(crop_y, crop_y + cropped_height), slice(crop_x, crop_x + cropped_width))
+    blur_buffers = BlurBuffers()
+    
+    free_q = queue.Queue()
+    decoded_q = queue.Queue()
+    blurred_q = queue.Queue()
+    for idx in range(_PIPELINE_FRAMES):
+        free_q.put(idx)
+    stop_event = threading.Event()
+    write_error = threading.Event()
+    write_frame = ffmpeg_proc.stdin.write if ffmpeg_proc is not None else out.write
+    
+    decoder = threading.Thread(target=_decode_frames, args=(cap, frames, free_q, decoded_q, stop_event), daemon=True)
+    writer = threading.Thread(target=_write_frames, args=(frames, blurred_q, free_q, crop, out_buf, write_frame, write_error), daemon=True)
+    decoder.start()
+    writer.start()
     
     was_cancelled = False
+    processing_error = False
     frame_count = 0
     
-    while True:
-        if cancel_check and cancel_check():
-            logger.info("Video processing cancelled by user")
-            was_cancelled = True
-            break
-        
-        success, frame = cap.read()
-        if not success:
-            break
-        
-        frame_count += 1
-        
-        detector.setInputSize((width, height))
-        results = detector.detect(frame)
-        
-        detections = []
-        if results[1] is not None:
-            for face in results[1]:
-                detections.append(face[0:4].astype(int).tolist())
-        
-        face_tracker.update(detections, frame)
-        blur_regions = face_tracker.get_blur_regions()
-        
-        for bbox in blur_regions:
-            apply_elliptical_blur(frame, bbox)
-        
-        cropped_frame = frame[crop_y:height-crop_y, crop_x:width-crop_x]
-        out.write(cropped_frame)
-
-    cap.release()
-    out.release()
+    try:
+        while True:
+            if cancel_check and frame_count % _CANCEL_CHECK_EVERY_N_FRAMES == 0 and cancel_check():
+                logger.info("Video processing cancelled by user")
+                was_cancelled = True
+                break
+            
+            try:
+                idx = decoded_q.get(timeout=_PIPELINE_POLL_SECONDS)
+            except queue.Empty:
+                # A stalled pipeline still notices write failures and /stop
+                if write_error.is_set():
+                    break
+                if cancel_check and cancel_check():
+                    logger.info("Video processing cancelled by user")
+                    was_cancelled = True
+                    break
+                continue
+            if idx is None or write_error.is_set():
+                break
+            frame = frames[idx]
+            
+            frame_count += 1
+            
+            if (frame_count - 1) % detect_every == 0:
+                if det_buf is not None:
+                    det_frame = cv2.resize(frame, (det_w, det_h), dst=det_buf, interpolation=cv2.INTER_AREA)
+                else:
+                    det_frame = frame
+                
+                results = detector.detect(det_frame)
+                
+                detections = []
+                if results[1] is not None:
+                    for face in results[1]:
+                        detections.append((face[0:4] * det_to_frame).astype(int).tolist())
+                
+                face_tracker.update(detections, frame)
+            else:
+                face_tracker.update_trackers_only(frame)
+            
+            blur_regions = face_tracker.get_blur_regions()
+            
+            for bbox in blur_regions:
+                apply_elliptical_blur(frame, bbox, blur_buffers)
+            
+            blurred_q.put(idx)
+    except Exception as e:
+        logger.error(f"Error blurring video frame {frame_count}: {e}")
+        processing_error = True
+    finally:
+        stop_event.set()
+        blurred_q.put(None)
+        decoder.join()
+        writer.join()
+        cap.release()
+    
+    write_failed = write_error.is_set()
     
-    del out
-    del cap
-    gc.collect()
-    time.sleep(0.5)
+    if out is not None:
+        out.release()
+    elif was_cancelled or processing_error:
+        ffmpeg_proc.kill()
+        ffmpeg_proc.wait()
+        ffmpeg_stderr.close()
     
-    if was_cancelled:
+    # A failed ffmpeg write is judged by ffmpeg's exit code below
+    if was_cancelled or processing_error or (out is not None and write_failed):
         try:
-            os.remove(temp_output)
-        except:
+            os.remove(output_path)
+        except OSError:
             pass
-        return False, True
+        return False, was_cancelled
     
-    ffmpeg_available = shutil.which('ffmpeg') is not None
+    if out is not None:
+        return True, False
     
-    if ffmpeg_available:
-        try:
-            cmd = [
-                'ffmpeg', '-y',
-                '-i', temp_output,
-                '-i', input_path,
-                '-c:v', 'libx264',
-                '-preset', 'fast',
-                '-crf', '23',
-                '-pix_fmt', 'yuv420p',
-                '-c:a', 'aac',
-                '-b:a', '128k',
-                '-map', '0:v:0',
-                '-map', '1:a:0?',
-                '-map_metadata', '-1',
-                '-map_chapters', '-1',
-                '-fflags', '+bitexact',
-                '-movflags', '+faststart',
-                '-shortest',
-                output_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                try:
-                    os.remove(temp_output)
-                except:
-                    pass
-                return True, False
-            else:
-                logger.warning(f"FFmpeg failed: {result.stderr}")
-                try:
-                    shutil.move(temp_output, output_path)
-                except:
-                    pass
-                return True, False
-        except Exception as e:
-            logger.error(f"FFmpeg error: {e}")
-            if os.path.exists(temp_output):
-                try:
-                    shutil.move(temp_output, output_path)
-                except:
-                    pass
-            return True, False
-    else:
+    try:
+        ffmpeg_proc.stdin.close()
+    except (BrokenPipeError, OSError):
+        write_failed = True
+    returncode = ffmpeg_proc.wait()
+    
+    if returncode != 0 or write_failed:
+        ffmpeg_stderr.seek(0)
+        error = ffmpeg_stderr.read().decode(errors='replace')
+        ffmpeg_stderr.close()
         try:
-            shutil.move(temp_output, output_path)
-        except:
+            os.remove(output_path)
+        except OSError:
             pass
-        return True, False
+        if returncode != 0:
+            raise _EncoderFailed(error)
+        return False, False
+    
+    ffmpeg_stderr.close()
+    return True, False
+
+
+def blur_faces_in_video(input_path: str, output_path: str, edge_crop_percent: int = 2, cancel_check=None) -> tuple[bool, bool]:
+    """
+    Blur faces in a video with tracking.
+    
+    Frames are piped straight into a single ffmpeg encode that also carries
+    over the original audio. If that encode fails, the video is processed
+    again with libx264, and finally written silently with OpenCV's VideoWriter
+    (also used when ffmpeg is not installed).
+    
+    Args:
+        input_path: Path to input video
+        output_path: Path to output video
+        edge_crop_percent: Percentage to crop from edges
+        cancel_check: Optional callable that returns True if processing should be cancelled
+    
+    Returns:
+        (success, was_cancelled) tuple
+    """
+    encoders = []
+    if shutil.which('ffmpeg') is not None:
+        encoders = [name for name in dict.fromkeys((get_video_encoder(), 'libx264')) if name not in _failed_encoders]
+    
+    for encoder in encoders:
+        try:
+            return _blur_video(input_path, output_path, edge_crop_percent, cancel_check, encoder)
+        except _EncoderFailed as e:
+            logger.warning(f"FFmpeg encode with {encoder} failed, falling back: {e}")
+            # A hardware encoder that rejects real streams is skipped from now on;
+            # a libx264 failure is more likely down to this input
+            if encoder != 'libx264':
+                _failed_encoders.add(encoder)
+    return _blur_video(input_path, output_path, edge_crop_percent, cancel_check, None)
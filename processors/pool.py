@@ -0,0 +1,107 @@
+"""
+KTBR - Processing Pool
+Runs CPU-heavy processors in worker processes, so jobs from different
+users run in parallel outside the GIL and never block the event loop.
+"""
+
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import PROCESS_POOL_WORKERS, VIDEO_DETECT_MAX_DIMENSION, logger
+
+
+_executor: ProcessPoolExecutor | None = None
+
+# Jobs beyond the worker count wait here, where they can still be cancelled cheaply
+_job_slots = asyncio.Semaphore(PROCESS_POOL_WORKERS)
+
+
+class CancelFlag:
+    """
+    Drop-in for threading.Event that also works across processes.
+    
+    Setting it creates a sentinel file that the worker polls through is_set(),
+    so its bound is_set method can be passed as a processor's cancel_check.
+    """
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, ".cancel")
+        self._set = False
+    
+    def set(self):
+        self._set = True
+        try:
+            open(self.path, 'w').close()
+        except OSError as e:
+            logger.warning(f"Could not set cancel flag: {e}")
+    
+    def is_set(self) -> bool:
+        if self._set:
+            return True
+        # A removed job directory also counts as cancelled
+        self._set = os.path.exists(self.path) or not os.path.isdir(self.directory)
+        return self._set
+
+
+def _init_worker():
+    """Load the face detector when a worker starts, not on its first job."""
+    # An initializer that raises breaks the whole pool; jobs retry the load themselves
+    try:
+        from processors.face_blur import get_detector
+        get_detector(VIDEO_DETECT_MAX_DIMENSION, VIDEO_DETECT_MAX_DIMENSION)
+    except Exception as e:
+        logger.error(f"Could not preload face detector: {e}")
+
+
+def _noop():
+    pass
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Get the shared process pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        # spawn: forking the threaded bot process is not safe
+        _executor = ProcessPoolExecutor(
+            max_workers=PROCESS_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        logger.info(f"Started processing pool with {PROCESS_POOL_WORKERS} workers")
+    return _executor
+
+
+async def run_in_pool(func, *args):
+    """Run func(*args) in the process pool without blocking the event loop."""
+    global _executor
+    loop = asyncio.get_running_loop()
+    try:
+        async with _job_slots:
+            return await loop.run_in_executor(get_executor(), func, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed by the OOM killer); start fresh next time
+        logger.error("Processing pool broke, restarting it for the next job")
+        _executor = None
+        raise
+
+
+async def warm_up_pool():
+    """Start every worker (and load its detector) ahead of the first job."""
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    try:
+        await asyncio.gather(*(loop.run_in_executor(executor, _noop) for _ in range(PROCESS_POOL_WORKERS)))
+    except BrokenProcessPool as e:
+        logger.error(f"Processing pool failed to start: {e}")
+
+
+def shutdown_pool():
+    """Stop the worker processes once their (cancelled) jobs have returned."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,100 @@
+"""
+KTBR - YuNet ONNX Runtime Backend
+Runs the int8-quantized YuNet model with onnxruntime instead of OpenCV DNN.
+Mirrors the setInputSize()/detect() interface of cv2.FaceDetectorYN.
+"""
+
+import cv2
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+
+class YuNetORT:
+    """YuNet face detector running on an onnxruntime CPU session."""
+
+    _STRIDES = (8, 16, 32)
+    _DIVISOR = 32
+
+    def __init__(self, model: str, input_size: tuple[int, int], score_threshold: float = 0.5, nms_threshold: float = 0.3, top_k: int = 5000):
+        self.session = ort.InferenceSession(model, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [
+            f"{kind}_{stride}"
+            for kind in ("cls", "obj", "bbox", "kps")
+            for stride in self._STRIDES
+        ]
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+        self.top_k = top_k
+        self.setInputSize(input_size)
+
+    def setInputSize(self, input_size: tuple[int, int]):
+        """Set the (width, height) of images passed to detect()."""
+        self.input_w, self.input_h = input_size
+        self.pad_w = ((self.input_w - 1) // self._DIVISOR + 1) * self._DIVISOR
+        self.pad_h = ((self.input_h - 1) // self._DIVISOR + 1) * self._DIVISOR
+        self.blob = np.zeros((1, 3, self.pad_h, self.pad_w), dtype=np.float32)
+
+        # Grid cell (col, row) of every anchor, per stride
+        self.anchors = []
+        for stride in self._STRIDES:
+            rows, cols = self.pad_h // stride, self.pad_w // stride
+            r, c = np.divmod(np.arange(rows * cols, dtype=np.float32), cols)
+            self.anchors.append(np.stack([c, r], axis=1))
+
+    def detect(self, image):
+        """
+        Detect faces in a BGR image of the configured input size.
+
+        Returns:
+            (1, faces) where faces is an (N, 15) float32 array
+            [x, y, w, h, 5 landmark (x, y) pairs, score], or None if no faces
+        """
+        # Zero-padded to a multiple of 32, raw BGR values, NCHW
+        self.blob[0, :, :self.input_h, :self.input_w] = image.transpose(2, 0, 1)
+        outputs = dict(zip(self.output_names, self.session.run(self.output_names, {self.input_name: self.blob})))
+
+        faces = []
+        for stride, anchors in zip(self._STRIDES, self.anchors):
+            cls_score = np.clip(outputs[f"cls_{stride}"].reshape(-1), 0, 1)
+            obj_score = np.clip(outputs[f"obj_{stride}"].reshape(-1), 0, 1)
+            scores = np.sqrt(cls_score * obj_score)
+
+            keep = scores >= self.score_threshold
+            if not keep.any():
+                continue
+
+            bbox = outputs[f"bbox_{stride}"].reshape(-1, 4)[keep]
+            kps = outputs[f"kps_{stride}"].reshape(-1, 10)[keep]
+            cells = anchors[keep]
+
+            centers = (cells + bbox[:, :2]) * stride
+            sizes = np.exp(bbox[:, 2:]) * stride
+            landmarks = (kps.reshape(-1, 5, 2) + cells[:, None, :]) * stride
+
+            faces.append(np.hstack([
+                centers - sizes / 2,
+                sizes,
+                landmarks.reshape(-1, 10),
+                scores[keep][:, None],
+            ]).astype(np.float32))
+
+        if not faces:
+            return 1, None
+        faces = np.vstack(faces)
+
+        if len(faces) > 1:
+            keep_idx = cv2.dnn.NMSBoxes(
+                faces[:, :4].astype(np.int32).tolist(),
+                faces[:, 14].tolist(),
+                self.score_threshold,
+                self.nms_threshold,
+                top_k=self.top_k,
+            )
+            faces = faces[np.asarray(keep_idx, dtype=np.int64).reshape(-1)]
+
+        return 1, faces
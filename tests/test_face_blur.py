@@ -0,0 +1,49 @@
+"""Tests for the face blur processor."""
+
+import unittest
+
+import cv2
+import numpy as np
+
+from processors.face_blur import BlurBuffers, apply_elliptical_blur, _encoded_image_size
+
+
+class BlurBuffersTest(unittest.TestCase):
+    def test_small_roi_after_large_roi_matches_fresh_buffer(self):
+        # Shared buffers once grew as a 2-D array, and stackBlur wrote a smaller
+        # ROI through the strided slice, leaving the face streaky and barely blurred
+        rng = np.random.default_rng(0)
+        image = (rng.random((600, 600, 3)) * 255).astype(np.uint8)
+        small_face = (450, 450, 100, 100)
+        
+        shared = BlurBuffers()
+        apply_elliptical_blur(image.copy(), (0, 0, 400, 400), shared)
+        with_shared = image.copy()
+        apply_elliptical_blur(with_shared, small_face, shared)
+        
+        with_fresh = image.copy()
+        apply_elliptical_blur(with_fresh, small_face, BlurBuffers())
+        
+        np.testing.assert_array_equal(with_shared, with_fresh)
+    
+    def test_view_is_contiguous(self):
+        buffers = BlurBuffers()
+        buffers.view(300, 400)
+        view = buffers.view(50, 70)
+        self.assertEqual(view.shape, (50, 70, 3))
+        self.assertTrue(view.flags['C_CONTIGUOUS'])
+
+
+class EncodedImageSizeTest(unittest.TestCase):
+    def test_reads_png_and_jpeg_headers(self):
+        image = np.zeros((37, 53, 3), dtype=np.uint8)
+        for ext in ('.png', '.jpg'):
+            data = cv2.imencode(ext, image)[1].tobytes()
+            self.assertEqual(_encoded_image_size(data), (53, 37))
+    
+    def test_unknown_format(self):
+        self.assertIsNone(_encoded_image_size(b"GIF89a" + bytes(32)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 """Utils package initialization."""
 
 from utils.auth import is_user_allowed, load_authorized_ids, save_authorized_ids
-from utils.tracking import FaceTrack, FaceTracker, calculate_iou
+from utils.tracking import FaceTracker, calculate_iou
 from utils.queue_manager import (
     is_server_busy,
     get_queue_length,
@@ -22,7 +22,6 @@ __all__ = [
     'is_user_allowed',
     'load_authorized_ids', 
     'save_authorized_ids',
-    'FaceTrack',
     'FaceTracker',
     'calculate_iou',
     # Queue management
@@ -3,10 +3,9 @@ KTBR - Access Request Manager
 Handles persistence of pending access requests.
 """
 
-import json
-import os
 import time
-from config import ACCESS_REQUESTS_FILE, logger
+from config import logger
+from utils import store
 
 # Request Statuses
 STATUS_PENDING = "pending"
@@ -14,37 +13,27 @@ STATUS_IGNORED = "ignored"
 
 def load_requests() -> dict:
     """
-    Load requests from JSON file.
+    Load all requests.
     structure: { "user_id": { "first_name": str, "username": str, "note": str, "status": str, "timestamp": float } }
     """
-    if os.path.exists(ACCESS_REQUESTS_FILE):
-        try:
-            with open(ACCESS_REQUESTS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Failed to load requests: {e}")
-            return {}
-    return {}
-
-def save_requests(data: dict):
-    """Save requests to JSON file."""
-    try:
-        with open(ACCESS_REQUESTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        logger.error(f"Failed to save requests: {e}")
+    rows = store.execute("SELECT user_id, first_name, username, note, status, ts FROM access_requests")
+    return {
+        str(user_id): {
+            "first_name": first_name,
+            "username": username,
+            "note": note,
+            "status": status,
+            "timestamp": ts
+        }
+        for user_id, first_name, username, note, status, ts in rows
+    }
 
 def add_request(user_id: int, first_name: str, username: str, note: str):
     """Add a new access request."""
-    data = load_requests()
-    data[str(user_id)] = {
-        "first_name": first_name,
-        "username": username,
-        "note": note,
-        "status": STATUS_PENDING,
-        "timestamp": time.time()
-    }
-    save_requests(data)
+    store.execute(
+        "INSERT OR REPLACE INTO access_requests (user_id, first_name, username, note, status, ts) VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, first_name, username, note, STATUS_PENDING, time.time())
+    )
     logger.info(f"New access request saved for user {user_id}")
 
 def get_request_status(user_id: int) -> str:
@@ -52,25 +41,18 @@ def get_request_status(user_id: int) -> str:
     Get status of a user's request.
     Returns: 'pending', 'ignored', or None (no request found)
     """
-    data = load_requests()
-    record = data.get(str(user_id))
-    if record:
-        return record.get("status")
-    return None
+    rows = store.execute("SELECT status FROM access_requests WHERE user_id = ?", (user_id,))
+    return rows[0][0] if rows else None
 
 def mark_ignored(user_id: int):
     """Mark a request as ignored/silently denied."""
-    data = load_requests()
-    str_id = str(user_id)
-    if str_id in data:
-        data[str_id]["status"] = STATUS_IGNORED
-        save_requests(data)
+    with store.transaction() as conn:
+        updated = conn.execute(
+            "UPDATE access_requests SET status = ? WHERE user_id = ?", (STATUS_IGNORED, user_id)
+        ).rowcount
+    if updated:
         logger.info(f"Access request for user {user_id} marked as ignored.")
 
 def remove_request(user_id: int):
     """Remove a request (e.g. after approval)."""
-    data = load_requests()
-    str_id = str(user_id)
-    if str_id in data:
-        del data[str_id]
-        save_requests(data)
+    store.execute("DELETE FROM access_requests WHERE user_id = ?", (user_id,))
@@ -3,40 +3,62 @@ KTBR - User Authorization Utilities
 Handles whitelist-based access control.
 """
 
-import json
-import os
-from config import ALLOWED_USERNAMES, AUTHORIZED_IDS_FILE, OWNER_ID, logger
+import asyncio
+
+from config import ALLOWED_USERNAMES, OWNER_ID, logger
+from utils import store
+from utils.queue_manager import run_in_background
+
+# In-memory copy of the authorized table, read once on first use
+_authorized_ids: set | None = None
+
+
+def _get_authorized_ids() -> set:
+    """Get the in-memory set of authorized user IDs."""
+    global _authorized_ids
+    if _authorized_ids is None:
+        _authorized_ids = {row[0] for row in store.execute("SELECT user_id FROM authorized")}
+    return _authorized_ids
+
+
+def _persist_authorized(user_id: int):
+    """Write an authorized user ID to the database."""
+    store.execute("INSERT OR IGNORE INTO authorized (user_id) VALUES (?)", (user_id,))
+
+
+def _authorize(user_id: int):
+    """Add a user ID to the in-memory set and the database."""
+    _get_authorized_ids().add(user_id)
+    _persist_authorized(user_id)
 
 
 def load_authorized_ids() -> list:
     """Load list of authorized user IDs."""
-    if os.path.exists(AUTHORIZED_IDS_FILE):
-        try:
-            with open(AUTHORIZED_IDS_FILE, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Failed to load authorized IDs: {e}")
-            return []
-    return []
-
+    return list(_get_authorized_ids())
 
 
 def save_authorized_ids(ids: list):
     """Save list of authorized user IDs."""
-    with open(AUTHORIZED_IDS_FILE, 'w') as f:
-        json.dump(ids, f, indent=2)
+    global _authorized_ids
+    _authorized_ids = set(ids)
+    with store.transaction() as conn:
+        conn.execute("DELETE FROM authorized")
+        conn.executemany("INSERT INTO authorized (user_id) VALUES (?)", [(i,) for i in _authorized_ids])
 
 
 def add_authorized_user(user_id: int):
     """Explicitly authorize a user ID."""
-    ids = load_authorized_ids()
-    if user_id not in ids:
-        ids.append(user_id)
-        save_authorized_ids(ids)
+    if user_id not in _get_authorized_ids():
+        _authorize(user_id)
         logger.info(f"Manually authorized user ID: {user_id}")
 
 
 
+def is_authorized_id(user_id: int) -> bool:
+    """Fast check for the owner or an already-authorized ID (no whitelist lookup)."""
+    return user_id == OWNER_ID or user_id in _get_authorized_ids()
+
+
 def is_user_allowed(username: str, user_id: int) -> tuple[bool, str]:
     """
     Check if user is allowed to use the bot.
@@ -54,7 +76,7 @@ def is_user_allowed(username: str, user_id: int) -> tuple[bool, str]:
     if user_id == OWNER_ID:
         return True, "✅ Access granted (Owner)"
 
-    authorized_ids = load_authorized_ids()
+    authorized_ids = _get_authorized_ids()
     
     # Check if ID is already authorized (instant access)
     if user_id in authorized_ids:
@@ -64,13 +86,11 @@ def is_user_allowed(username: str, user_id: int) -> tuple[bool, str]:
     if not username:
         return False, "🚫 You are not allowed to use this service.\n\nContact the owner for access."
     
-    username_lower = username.lower()
-    allowed_usernames_lower = [u.lower() for u in ALLOWED_USERNAMES]
-    
-    if username_lower in allowed_usernames_lower:
-        # Username is allowed - authorize this ID
-        authorized_ids.append(user_id)
-        save_authorized_ids(authorized_ids)
+    if username.lower() in ALLOWED_USERNAMES:
+        # Username is allowed - authorize this ID; the set answers from now on,
+        # the database write runs off the event loop
+        _get_authorized_ids().add(user_id)
+        run_in_background(asyncio.to_thread(_persist_authorized, user_id))
         logger.info(f"Authorized new user: @{username} (ID: {user_id})")
         return True, "✅ Access granted"
     
@@ -1,8 +1,11 @@
+import time
 from functools import wraps
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils.auth import is_user_allowed
+from telegram.constants import ParseMode
+from utils.auth import is_user_allowed, is_authorized_id
 from utils.access_manager import get_request_status, STATUS_PENDING, STATUS_IGNORED
+from config import RATE_LIMIT_BURST, RATE_LIMIT_PER_SECOND, rate_buckets
 
 def require_auth(func):
     """
@@ -14,11 +17,14 @@ def require_auth(func):
     """
     @wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
-        user = update.effective_user
+        # Queued jobs are replayed with update=None; they were authorized when queued
+        user = update.effective_user if update else None
         if not user:
             return await func(update, context, *args, **kwargs)
 
-        # 1. Check if Authorized
+        # 1. Check if Authorized (known IDs first, then the username whitelist)
+        if is_authorized_id(user.id):
+            return await func(update, context, *args, **kwargs)
         is_allowed, msg = is_user_allowed(user.username, user.id)
         if is_allowed:
             return await func(update, context, *args, **kwargs)
@@ -38,7 +44,7 @@ def require_auth(func):
                 "Please wait for the administrator."
             )
              # Reply quoting the user's message if possible
-             await message.reply_text(text, parse_mode="Markdown")
+             await message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
              return
 
         # 3. Unauthorized & New -> Show Button
@@ -52,8 +58,46 @@ def require_auth(func):
             "You are not authorized to use this bot.\n"
             "To request access, click the button below.",
             reply_markup=reply_markup,
-            parse_mode="Markdown"
+            parse_mode=ParseMode.MARKDOWN
         )
         return
 
     return wrapper
+
+
+# Seconds for an idle bucket to refill completely; a full bucket is the same as
+# no bucket, so entries idle this long are dropped to keep rate_buckets bounded
+_BUCKET_REFILL_SECONDS = RATE_LIMIT_BURST / RATE_LIMIT_PER_SECOND
+_last_bucket_sweep = 0.0
+
+
+def _sweep_rate_buckets(now: float):
+    """Drop buckets that have refilled, at most once per refill period."""
+    global _last_bucket_sweep
+    if now - _last_bucket_sweep < _BUCKET_REFILL_SECONDS:
+        return
+    _last_bucket_sweep = now
+    for chat_id in [cid for cid, (last, _) in rate_buckets.items() if now - last >= _BUCKET_REFILL_SECONDS]:
+        del rate_buckets[chat_id]
+
+
+def rate_limit(func):
+    """
+    Decorator that silently drops updates from a chat sending faster than
+    RATE_LIMIT_PER_SECOND (with bursts up to RATE_LIMIT_BURST).
+    Apply it above require_auth so floods never reach the auth check.
+    """
+    @wraps(func)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        chat = update.effective_chat
+        if chat:
+            now = time.monotonic()
+            _sweep_rate_buckets(now)
+            last, tokens = rate_buckets.get(chat.id, (now, RATE_LIMIT_BURST))
+            tokens = min(RATE_LIMIT_BURST, tokens + (now - last) * RATE_LIMIT_PER_SECOND)
+            if tokens < 1.0:
+                return
+            rate_buckets[chat.id] = (now, tokens - 1.0)
+        return await func(update, context, *args, **kwargs)
+
+    return wrapper
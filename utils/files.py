@@ -0,0 +1,123 @@
+"""
+KTBR - File Helpers
+Moves Telegram media to and from disk or memory without blocking the event loop.
+"""
+
+import os
+import shutil
+import asyncio
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from telegram import InputFile
+
+from config import MAX_CONCURRENT_JOBS
+
+
+async def download_telegram_file(bot, file_id: str, path: str):
+    """
+    Download a Telegram file to path.
+    
+    PTB's download_to_drive writes the downloaded bytes on the event loop;
+    here the body is fetched asynchronously and written from a worker thread.
+    """
+    file = await bot.get_file(file_id)
+    data = await file.download_as_bytearray()
+    await asyncio.to_thread(Path(path).write_bytes, data)
+
+
+async def download_telegram_bytes(bot, file_id: str) -> bytearray:
+    """Download a Telegram file into memory (for images small enough to skip the disk)."""
+    file = await bot.get_file(file_id)
+    return await file.download_as_bytearray()
+
+
+# Upload write timeout: PTB's 20s media default, stretched for large results
+UPLOAD_MIN_WRITE_TIMEOUT = 20.0
+UPLOAD_SEC_PER_MB = 1.0
+
+
+async def send_result_file(bot, chat_id: int, path: str, filename: str, caption: str):
+    """
+    Upload a result file from disk as a document.
+    
+    The open file handle is passed through to the HTTP transport, which
+    streams it in chunks, so the result is never held in memory as a whole;
+    the file is closed once the upload finishes.
+    """
+    with open(path, 'rb') as f:
+        size_mb = os.fstat(f.fileno()).st_size / (1024 * 1024)
+        return await bot.send_document(
+            chat_id=chat_id,
+            document=InputFile(f, filename=filename, read_file_handle=False),
+            caption=caption,
+            write_timeout=max(UPLOAD_MIN_WRITE_TIMEOUT, size_mb * UPLOAD_SEC_PER_MB),
+        )
+
+
+async def send_result_bytes(bot, chat_id: int, data: bytes, filename: str, caption: str):
+    """Upload an in-memory result as a document."""
+    return await bot.send_document(
+        chat_id=chat_id,
+        document=InputFile(data, filename=filename),
+        caption=caption,
+        write_timeout=max(UPLOAD_MIN_WRITE_TIMEOUT, len(data) / (1024 * 1024) * UPLOAD_SEC_PER_MB),
+    )
+
+
+class TempDirPool:
+    """
+    Bounded pool of job directories.
+    
+    Directories are emptied and reused instead of being created and
+    removed for every job; at most size idle directories are kept.
+    """
+    
+    def __init__(self, size: int):
+        self.size = size
+        self._free: list[str] = []
+    
+    def acquire(self) -> str:
+        """Get an empty directory for a job."""
+        if self._free:
+            return self._free.pop()
+        return tempfile.mkdtemp(prefix="ktbr_")
+    
+    def release(self, path: str, reuse: bool = True):
+        """
+        Empty a job directory and return it to the pool.
+        
+        Pass reuse=False when a worker may still be using it (e.g. after a
+        cancel); the directory is then removed instead.
+        """
+        if reuse and len(self._free) < self.size:
+            try:
+                for entry in os.scandir(path):
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path)
+                    else:
+                        os.unlink(entry.path)
+                self._free.append(path)
+                return
+            except OSError:
+                pass
+        shutil.rmtree(path, ignore_errors=True)
+    
+    @contextmanager
+    def borrow(self):
+        """Context manager form of acquire()/release()."""
+        path = self.acquire()
+        try:
+            yield path
+        finally:
+            self.release(path)
+    
+    def clear(self):
+        """Remove all idle directories (on shutdown)."""
+        while self._free:
+            shutil.rmtree(self._free.pop(), ignore_errors=True)
+
+
+# One directory per job slot, plus one for a job that is just finishing
+temp_dirs = TempDirPool(MAX_CONCURRENT_JOBS + 1)
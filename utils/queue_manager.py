@@ -4,7 +4,9 @@ Handles processing queue and user cooldowns.
 """
 
 import time
+import shutil
 import asyncio
+from telegram.constants import ParseMode
 from config import (
     MAX_CONCURRENT_JOBS,
     processing_queue,
@@ -16,6 +18,21 @@ from config import (
 )
 
 
+# =============================================================================
+# ACTIVE JOBS
+# =============================================================================
+
+class TaskHandle:
+    """A running job, stored in active_tasks under its user's ID."""
+    __slots__ = ("type", "temp_dir", "cancel_event", "task")
+    
+    def __init__(self, type: str, temp_dir: str = None, cancel_event=None, task: asyncio.Task = None):
+        self.type = type
+        self.temp_dir = temp_dir
+        self.cancel_event = cancel_event
+        self.task = task
+
+
 # =============================================================================
 # QUEUE MANAGEMENT
 # =============================================================================
@@ -40,15 +57,17 @@ def get_queue_position(user_id: int) -> int:
     Get user's position in queue (1-indexed).
     Returns 0 if not in queue.
     """
-    for i, entry in enumerate(processing_queue):
-        if entry["user_id"] == user_id:
+    if user_id not in processing_queue:
+        return 0
+    for i, queued_id in enumerate(processing_queue):
+        if queued_id == user_id:
             return i + 1
     return 0
 
 
 def is_in_queue(user_id: int) -> bool:
     """Check if user is already in the queue."""
-    return get_queue_position(user_id) > 0
+    return user_id in processing_queue
 
 
 def add_to_queue(user_id: int, chat_id: int, file_size_mb: float, file_id: str, file_type: str, metadata: dict, queue_msg_id: int = None) -> int:
@@ -57,15 +76,15 @@ def add_to_queue(user_id: int, chat_id: int, file_size_mb: float, file_id: str,
     Returns their position (1-indexed).
     """
     # If already in queue, update their data
-    for item in processing_queue:
-        if item["user_id"] == user_id:
-            item["file_size_mb"] = file_size_mb
-            item["file_id"] = file_id
-            item["file_type"] = file_type
-            item["metadata"] = metadata
-            if queue_msg_id:
-                item["queue_msg_id"] = queue_msg_id
-            return get_queue_position(user_id)
+    item = processing_queue.get(user_id)
+    if item is not None:
+        item["file_size_mb"] = file_size_mb
+        item["file_id"] = file_id
+        item["file_type"] = file_type
+        item["metadata"] = metadata
+        if queue_msg_id:
+            item["queue_msg_id"] = queue_msg_id
+        return get_queue_position(user_id)
     
     entry = {
         "user_id": user_id,
@@ -77,7 +96,7 @@ def add_to_queue(user_id: int, chat_id: int, file_size_mb: float, file_id: str,
         "metadata": metadata, # user mode, etc
         "queue_msg_id": queue_msg_id
     }
-    processing_queue.append(entry)
+    processing_queue[user_id] = entry
     position = len(processing_queue)
     logger.info(f"User {user_id} added to queue at position {position} with file {file_id}")
     return position
@@ -88,13 +107,10 @@ def remove_from_queue(user_id: int) -> bool:
     Remove user from the queue.
     Returns True if removed, False if not found.
     """
-    global processing_queue
-    for i, entry in enumerate(processing_queue):
-        if entry["user_id"] == user_id:
-            processing_queue.pop(i)
-            logger.info(f"User {user_id} removed from queue")
-            return True
-    return False
+    if processing_queue.pop(user_id, None) is None:
+        return False
+    logger.info(f"User {user_id} removed from queue")
+    return True
 
 
 def get_next_in_queue() -> dict | None:
@@ -103,9 +119,7 @@ def get_next_in_queue() -> dict | None:
     Returns None if queue is empty.
     Does NOT remove from queue - call remove_from_queue separately.
     """
-    if processing_queue:
-        return processing_queue[0]
-    return None
+    return next(iter(processing_queue.values()), None)
 
 
 def estimate_wait_time(position: int, avg_file_size_mb: float = 10) -> int:
@@ -161,10 +175,11 @@ def set_cooldown(user_id: int) -> None:
 
 def is_on_cooldown(user_id: int) -> bool:
     """Check if user is currently on cooldown."""
-    if user_id not in user_cooldowns:
+    cooldown_ends = user_cooldowns.get(user_id)
+    if cooldown_ends is None:
         return False
     
-    if time.time() >= user_cooldowns[user_id]:
+    if time.time() >= cooldown_ends:
         # Cooldown expired, clean up
         del user_cooldowns[user_id]
         return False
@@ -174,10 +189,11 @@ def is_on_cooldown(user_id: int) -> bool:
 
 def get_cooldown_remaining(user_id: int) -> int:
     """Get remaining cooldown time in seconds. Returns 0 if not on cooldown."""
-    if user_id not in user_cooldowns:
+    cooldown_ends = user_cooldowns.get(user_id)
+    if cooldown_ends is None:
         return 0
     
-    remaining = user_cooldowns[user_id] - time.time()
+    remaining = cooldown_ends - time.time()
     if remaining <= 0:
         # Cooldown expired, clean up
         del user_cooldowns[user_id]
@@ -188,8 +204,7 @@ def get_cooldown_remaining(user_id: int) -> int:
 
 def clear_cooldown(user_id: int) -> None:
     """Clear cooldown for a user (admin function)."""
-    if user_id in user_cooldowns:
-        del user_cooldowns[user_id]
+    if user_cooldowns.pop(user_id, None) is not None:
         logger.info(f"Cooldown cleared for user {user_id}")
 
 
@@ -212,7 +227,8 @@ async def update_all_queue_messages(context) -> None:
     """
     Iterate through the queue and update everyone's position and ETA message.
     """
-    for i, entry in enumerate(processing_queue):
+    # Snapshot: users can join or leave while we await the edits
+    for i, entry in enumerate(list(processing_queue.values())):
         user_id = entry["user_id"]
         chat_id = entry["chat_id"]
         msg_id = entry.get("queue_msg_id")
@@ -233,7 +249,7 @@ async def update_all_queue_messages(context) -> None:
                      f"Your file is saved. It will start automatically when it's your turn.\n"
                      f"**You do NOT need to re-upload.**\n\n"
                      f"❌ Use /stop to leave the queue.",
-                parse_mode='Markdown'
+                parse_mode=ParseMode.MARKDOWN
             )
         except Exception as e:
             # If message can't be edited (e.g. deleted), it's fine
@@ -265,7 +281,7 @@ async def notify_next_in_queue(context) -> dict | None:
             text=f"✅ **It's your turn!**\n\n"
                  f"Processing has started automatically.\n"
                  f"**Please do NOT send the file again.**",
-            parse_mode='Markdown'
+            parse_mode=ParseMode.MARKDOWN
         )
         logger.info(f"Auto-notified user {user_id} of their turn")
         return next_user
@@ -273,3 +289,82 @@ async def notify_next_in_queue(context) -> dict | None:
         logger.error(f"Failed to notify user {user_id}: {e}")
         remove_from_queue(user_id)
         return None
+
+
+# =============================================================================
+# BACKGROUND TASKS
+# =============================================================================
+
+# Strong references to fire-and-forget tasks; the event loop only keeps weak ones
+background_tasks: set = set()
+
+
+def run_in_background(coro) -> asyncio.Task:
+    """Start a fire-and-forget task that is kept alive until it finishes."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+def start_job(user_id: int, task_type: str, coro) -> asyncio.Task:
+    """
+    Run a processing job in the background.
+    The user's active_tasks slot is taken immediately, so updates handled before
+    the job's first step still see the user as busy; the job then fills in its handle.
+    """
+    task = run_in_background(coro)
+    active_tasks[user_id] = TaskHandle(task_type, task=task)
+    
+    def _release_slot(task):
+        # Normally the job removes its own entry; this covers a job that failed before registering
+        handle = active_tasks.get(user_id)
+        if handle is not None and handle.task is task:
+            del active_tasks[user_id]
+    
+    task.add_done_callback(_release_slot)
+    return task
+
+
+# =============================================================================
+# SHUTDOWN
+# =============================================================================
+
+_shutting_down = False
+
+
+def is_shutting_down() -> bool:
+    """Check if the bot is shutting down (no new jobs should start)."""
+    return _shutting_down
+
+
+async def cancel_active_tasks():
+    """Abort all running jobs, wait for them to finish and remove their temp files."""
+    global _shutting_down
+    _shutting_down = True
+    
+    handles = list(active_tasks.values())
+    tasks = []
+    for handle in handles:
+        if handle.cancel_event:
+            handle.cancel_event.set()
+        task = handle.task
+        if task is not None and task is not asyncio.current_task() and not task.done():
+            task.cancel()
+            tasks.append(task)
+    
+    if tasks:
+        logger.info(f"Cancelling {len(tasks)} running job(s) for shutdown")
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    for handle in handles:
+        if handle.temp_dir:
+            shutil.rmtree(handle.temp_dir, ignore_errors=True)
+    
+    # Pending auto-deletes and queue triggers (including ones the cancelled
+    # jobs just scheduled) would otherwise outlive the event loop
+    pending = [task for task in background_tasks if task is not asyncio.current_task()]
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,45 @@
+"""
+KTBR - Result Cache
+Keeps recently blurred images in memory so repeated uploads skip processing.
+"""
+
+from collections import OrderedDict
+
+from config import RESULT_CACHE_MAX_MB
+
+
+class ResultCache:
+    """LRU cache of encoded results, bounded by their total size in bytes."""
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._size = 0
+    
+    def get(self, key) -> bytes | None:
+        """Return the cached result for key (marking it recently used), or None."""
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+        return data
+    
+    def put(self, key, data: bytes):
+        """Store a result, evicting the least recently used ones to stay within max_bytes."""
+        if len(data) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+    
+    def clear(self):
+        self._entries.clear()
+        self._size = 0
+
+
+# Blurred images keyed by (Telegram file_id or SHA-256 of the upload, output extension)
+image_results = ResultCache(RESULT_CACHE_MAX_MB * 1024 * 1024)
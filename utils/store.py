@@ -0,0 +1,142 @@
+"""
+KTBR - Persistent Store
+SQLite database for authorized users, access requests and user modes.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import DATABASE_FILE, AUTHORIZED_IDS_FILE, ACCESS_REQUESTS_FILE, logger
+
+# Bump when the schema changes; stored in PRAGMA user_version
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS authorized (
+    user_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS access_requests (
+    user_id INTEGER PRIMARY KEY,
+    first_name TEXT,
+    username TEXT,
+    note TEXT,
+    status TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_modes (
+    user_id INTEGER PRIMARY KEY,
+    mode TEXT NOT NULL,
+    voice_level TEXT NOT NULL
+);
+"""
+
+_conn: sqlite3.Connection | None = None
+# One connection is shared by the event loop and worker threads
+_lock = threading.Lock()
+
+
+def _migrate_json(conn: sqlite3.Connection):
+    """Import the legacy authorized_ids.json / access_requests.json files."""
+    if os.path.exists(AUTHORIZED_IDS_FILE):
+        try:
+            with open(AUTHORIZED_IDS_FILE, 'r') as f:
+                ids = json.load(f)
+            conn.executemany("INSERT OR IGNORE INTO authorized (user_id) VALUES (?)", [(int(i),) for i in ids])
+            logger.info(f"Migrated {len(ids)} authorized IDs from {AUTHORIZED_IDS_FILE}")
+        except (json.JSONDecodeError, OSError, ValueError) as e:
+            logger.error(f"Failed to migrate authorized IDs: {e}")
+
+    if os.path.exists(ACCESS_REQUESTS_FILE):
+        try:
+            with open(ACCESS_REQUESTS_FILE, 'r', encoding='utf-8') as f:
+                requests = json.load(f)
+            conn.executemany(
+                "INSERT OR IGNORE INTO access_requests (user_id, first_name, username, note, status, ts) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (int(uid), r.get("first_name"), r.get("username"), r.get("note"), r.get("status"), r.get("timestamp", 0.0))
+                    for uid, r in requests.items()
+                ],
+            )
+            logger.info(f"Migrated {len(requests)} access requests from {ACCESS_REQUESTS_FILE}")
+        except (json.JSONDecodeError, OSError, ValueError, AttributeError) as e:
+            logger.error(f"Failed to migrate access requests: {e}")
+
+
+def get_connection() -> sqlite3.Connection:
+    """Open the database on first use, creating and migrating it if needed."""
+    global _conn
+    if _conn is None:
+        with _lock:
+            if _conn is None:
+                conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                    conn.execute("BEGIN")
+                    for statement in _SCHEMA.split(";"):
+                        if statement.strip():
+                            conn.execute(statement)
+                    _migrate_json(conn)
+                    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                    conn.execute("COMMIT")
+                _conn = conn
+    return _conn
+
+
+def execute(sql: str, params: tuple = ()) -> list:
+    """Run one parameterised statement and return all result rows."""
+    conn = get_connection()
+    with _lock:
+        return conn.execute(sql, params).fetchall()
+
+
+@contextmanager
+def transaction():
+    """Run several statements atomically on the shared connection."""
+    conn = get_connection()
+    with _lock:
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def close():
+    """Close the database connection (e.g. on shutdown)."""
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+
+
+class UserMode:
+    """A user's processing mode ("face" | "voice") and voice level ("fast" | "secure")."""
+    
+    __slots__ = ("mode", "voice_level")
+    
+    def __init__(self, mode: str = "face", voice_level: str = "fast"):
+        self.mode = mode
+        self.voice_level = voice_level
+
+
+def load_user_mode(user_id: int) -> UserMode | None:
+    """Load a user's saved mode settings, or None if they never chose one."""
+    rows = execute("SELECT mode, voice_level FROM user_modes WHERE user_id = ?", (user_id,))
+    if not rows:
+        return None
+    return UserMode(rows[0][0], rows[0][1])
+
+
+def save_user_mode(user_id: int, mode: str, voice_level: str):
+    """Persist a user's mode settings."""
+    execute(
+        "INSERT OR REPLACE INTO user_modes (user_id, mode, voice_level) VALUES (?, ?, ?)",
+        (user_id, mode, voice_level)
+    )
@@ -0,0 +1,125 @@
+"""
+KTBR - Tracker Matching Kernels
+Scores and greedily assigns detections to face tracks.
+Compiled with Numba when it is installed, plain NumPy otherwise.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _match_greedy_loops(tracks, dets, iou_threshold, distance_ratio):
+    """
+    Loop form of the matcher, compiled by Numba.
+
+    tracks: (T, 4) float64 [x, y, w, h], dets: (D, 4) float64 [x, y, w, h]
+    Returns (T,) int64 array of matched detection index per track, -1 if none.
+    """
+    n_tracks = tracks.shape[0]
+    n_dets = dets.shape[0]
+    matches = np.full(n_tracks, -1, dtype=np.int64)
+    used = np.zeros(n_dets, dtype=np.bool_)
+
+    for i in range(n_tracks):
+        tx, ty, tw, th = tracks[i, 0], tracks[i, 1], tracks[i, 2], tracks[i, 3]
+        best_score = -1.0
+        best_det_idx = -1
+
+        for j in range(n_dets):
+            if used[j]:
+                continue
+            dx, dy, dw, dh = dets[j, 0], dets[j, 1], dets[j, 2], dets[j, 3]
+
+            inter_w = min(tx + tw, dx + dw) - max(tx, dx)
+            inter_h = min(ty + th, dy + dh) - max(ty, dy)
+            iou = 0.0
+            if inter_w > 0 and inter_h > 0:
+                inter_area = inter_w * inter_h
+                union_area = tw * th + dw * dh - inter_area
+                if union_area > 0:
+                    iou = inter_area / union_area
+
+            if iou >= iou_threshold:
+                score = iou + 1
+            else:
+                avg_size = (tw + th + dw + dh) / 4
+                cx = (tx + tw / 2) - (dx + dw / 2)
+                cy = (ty + th / 2) - (dy + dh / 2)
+                distance = (cx * cx + cy * cy) ** 0.5
+                max_distance = avg_size * distance_ratio
+                if distance >= max_distance:
+                    continue
+                score = 1 - (distance / max_distance)
+
+            if score > best_score:
+                best_score = score
+                best_det_idx = j
+
+        if best_det_idx >= 0:
+            matches[i] = best_det_idx
+            used[best_det_idx] = True
+
+    return matches
+
+
+def _match_greedy_numpy(tracks, dets, iou_threshold, distance_ratio):
+    """Broadcast form of the matcher, used when Numba is unavailable."""
+    t = tracks[:, None, :]
+    d = dets[None, :, :]
+
+    inter_w = np.minimum(t[..., 0] + t[..., 2], d[..., 0] + d[..., 2]) - np.maximum(t[..., 0], d[..., 0])
+    inter_h = np.minimum(t[..., 1] + t[..., 3], d[..., 1] + d[..., 3]) - np.maximum(t[..., 1], d[..., 1])
+    inter_area = np.clip(inter_w, 0, None) * np.clip(inter_h, 0, None)
+    union_area = t[..., 2] * t[..., 3] + d[..., 2] * d[..., 3] - inter_area
+    iou = np.divide(inter_area, union_area, out=np.zeros_like(inter_area), where=union_area > 0)
+
+    distance = np.hypot(
+        (t[..., 0] + t[..., 2] / 2) - (d[..., 0] + d[..., 2] / 2),
+        (t[..., 1] + t[..., 3] / 2) - (d[..., 1] + d[..., 3] / 2),
+    )
+    avg_size = (t[..., 2] + t[..., 3] + d[..., 2] + d[..., 3]) / 4
+    max_distance = avg_size * distance_ratio
+    close = distance < max_distance
+    distance_score = np.full_like(distance, -1.0)
+    np.subtract(1, distance / np.where(close, max_distance, 1), out=distance_score, where=close)
+
+    # IoU matches score iou + 1, close centers score in (0, 1], the rest -1
+    scores = np.where(iou >= iou_threshold, iou + 1, distance_score)
+
+    matches = np.full(len(tracks), -1, dtype=np.int64)
+    used = np.zeros(len(dets), dtype=bool)
+    for i, track_scores in enumerate(scores):
+        track_scores[used] = -1
+        best_det_idx = int(track_scores.argmax())
+        if track_scores[best_det_idx] > -1:
+            matches[i] = best_det_idx
+            used[best_det_idx] = True
+    return matches
+
+
+if njit is not None:
+    _match_greedy = njit(cache=True)(_match_greedy_loops)
+    # Compile once at import instead of on the first video frame
+    _match_greedy(np.zeros((1, 4)), np.zeros((1, 4)), 0.5, 1.0)
+else:
+    _match_greedy = _match_greedy_numpy
+
+
+def match_detections(tracks, detections, iou_threshold: float, distance_ratio: float) -> np.ndarray:
+    """
+    Greedily match detections to tracks in track order.
+
+    Each track takes its best unused detection: an IoU match scores iou + 1,
+    otherwise centers closer than distance_ratio * average face size score
+    by proximity.
+
+    Returns:
+        Array with the matched detection index per track, -1 if unmatched
+    """
+    tracks_arr = np.ascontiguousarray(tracks, dtype=np.float64).reshape(-1, 4)
+    dets_arr = np.ascontiguousarray(detections, dtype=np.float64).reshape(-1, 4)
+    return _match_greedy(tracks_arr, dets_arr, float(iou_threshold), float(distance_ratio))
@@ -4,6 +4,10 @@ Handles face tracking across video frames.
 """
 
 import cv2
+import numpy as np
+
+from config import logger
+from utils.tracker_kernels import match_detections
 
 
 def calculate_iou(box1, box2):
@@ -30,117 +34,111 @@ def calculate_iou(box1, box2):
     return inter_area / union_area if union_area > 0 else 0.0
 
 
-class FaceTrack:
-    """Represents a single tracked face."""
-    _next_id = 0
-    
-    def __init__(self, bbox, frame):
-        self.id = FaceTrack._next_id
-        FaceTrack._next_id += 1
-        self.bbox = list(bbox)
-        self.frames_since_detection = 0
-        self.max_frames_without_detection = 20
-        self.tracker = None
-        self.init_tracker(frame, bbox)
-    
-    def init_tracker(self, frame, bbox):
-        try:
-            self.tracker = cv2.TrackerKCF_create()
-            x, y, w, h = [int(v) for v in bbox]
-            h_frame, w_frame = frame.shape[:2]
-            x = max(0, min(x, w_frame - 1))
-            y = max(0, min(y, h_frame - 1))
-            w = max(1, min(w, w_frame - x))
-            h = max(1, min(h, h_frame - y))
-            self.tracker.init(frame, (x, y, w, h))
-        except Exception as e:
-            self.tracker = None
-    
-    def update_with_detection(self, bbox, frame):
-        self.bbox = list(bbox)
-        self.frames_since_detection = 0
-        self.init_tracker(frame, bbox)
-    
-    def update_with_tracker(self, frame):
-        self.frames_since_detection += 1
-        if self.tracker is not None:
-            try:
-                success, box = self.tracker.update(frame)
-                if success:
-                    self.bbox = [int(box[0]), int(box[1]), int(box[2]), int(box[3])]
-                    return True
-            except:
-                pass
-        return False
-    
-    def is_valid(self):
-        return self.frames_since_detection < self.max_frames_without_detection
-    
-    def get_blur_bbox(self):
-        x, y, w, h = self.bbox
-        expand_ratio = 0.6
-        expand_w = int(w * expand_ratio / 2)
-        expand_h = int(h * expand_ratio / 2)
-        return [x - expand_w, y - expand_h, w + expand_w * 2, h + expand_h * 2]
+# KCF lives in opencv-contrib; without it tracks just follow detections
+HAS_KCF = hasattr(cv2, "TrackerKCF_create")
+if not HAS_KCF:
+    logger.warning("cv2.TrackerKCF_create not available, detecting faces on every video frame")
+
+
+def _create_tracker(frame, bbox):
+    """Create a KCF tracker on bbox clamped to the frame, or None if KCF is unavailable."""
+    if not HAS_KCF:
+        return None
+    tracker = cv2.TrackerKCF_create()
+    x, y, w, h = [int(v) for v in bbox]
+    h_frame, w_frame = frame.shape[:2]
+    x = max(0, min(x, w_frame - 1))
+    y = max(0, min(y, h_frame - 1))
+    w = max(1, min(w, w_frame - x))
+    h = max(1, min(h, h_frame - y))
+    tracker.init(frame, (x, y, w, h))
+    return tracker
 
 
 class FaceTracker:
-    """Manages multiple face tracks."""
+    """
+    Manages multiple face tracks.
+    
+    Track state is stored column-wise: row i of bboxes and frames_since
+    and entry i of trackers and ids all describe track i.
+    """
     
     def __init__(self):
-        self.tracks = []
+        self.bboxes = np.empty((0, 4), dtype=np.float64)
+        self.frames_since = np.empty(0, dtype=np.int32)
+        self.trackers = []
+        self.ids = []
+        self._next_id = 0
         self.iou_threshold = 0.15
         self.distance_threshold_ratio = 1.5
-    
-    def _get_center(self, bbox):
-        x, y, w, h = bbox
-        return (x + w / 2, y + h / 2)
-    
-    def _get_distance(self, bbox1, bbox2):
-        c1 = self._get_center(bbox1)
-        c2 = self._get_center(bbox2)
-        return ((c1[0] - c2[0]) ** 2 + (c1[1] - c2[1]) ** 2) ** 0.5
+        self.max_frames_without_detection = 20
+        self.reinit_iou_threshold = 0.5
+        self.expand_ratio = 0.6
+    
+    def _advance_trackers(self, frame):
+        self.frames_since += 1
+        for i, tracker in enumerate(self.trackers):
+            if tracker is not None:
+                success, box = tracker.update(frame)
+                if success:
+                    self.bboxes[i] = [int(v) for v in box]
+    
+    def _update_with_detection(self, i, bbox, frame):
+        # Keep the learned KCF model unless the tracker drifted off the face
+        drifted = calculate_iou(self.bboxes[i].tolist(), bbox) <= self.reinit_iou_threshold
+        self.bboxes[i] = bbox
+        self.frames_since[i] = 0
+        if self.trackers[i] is None or drifted:
+            self.trackers[i] = _create_tracker(frame, bbox)
+    
+    def _add_tracks(self, detections, frame):
+        self.bboxes = np.vstack([self.bboxes, np.asarray(detections, dtype=np.float64)])
+        self.frames_since = np.concatenate([self.frames_since, np.zeros(len(detections), dtype=np.int32)])
+        for det in detections:
+            self.trackers.append(_create_tracker(frame, det))
+            self.ids.append(self._next_id)
+            self._next_id += 1
+    
+    def _drop_stale_tracks(self):
+        keep = self.frames_since < self.max_frames_without_detection
+        if keep.all():
+            return
+        idx = np.flatnonzero(keep)
+        self.bboxes = np.take(self.bboxes, idx, axis=0)
+        self.frames_since = np.take(self.frames_since, idx)
+        self.trackers = [self.trackers[i] for i in idx]
+        self.ids = [self.ids[i] for i in idx]
     
     def update(self, detections, frame):
-        for track in self.tracks:
-            track.update_with_tracker(frame)
+        self._advance_trackers(frame)
         
         used_detections = set()
         
-        for track in self.tracks:
-            best_score = -1
-            best_det_idx = -1
-            
-            for i, det in enumerate(detections):
-                if i in used_detections:
-                    continue
-                
-                iou = calculate_iou(track.bbox, det)
-                if iou >= self.iou_threshold:
-                    score = iou + 1
-                    if score > best_score:
-                        best_score = score
-                        best_det_idx = i
-                else:
-                    avg_size = (track.bbox[2] + track.bbox[3] + det[2] + det[3]) / 4
-                    distance = self._get_distance(track.bbox, det)
-                    max_distance = avg_size * self.distance_threshold_ratio
-                    
-                    if distance < max_distance:
-                        score = 1 - (distance / max_distance)
-                        if score > best_score:
-                            best_score = score
-                            best_det_idx = i
-            
-            if best_det_idx >= 0:
-                track.update_with_detection(detections[best_det_idx], frame)
-                used_detections.add(best_det_idx)
+        if self.ids and detections:
+            matches = match_detections(
+                self.bboxes,
+                detections,
+                self.iou_threshold,
+                self.distance_threshold_ratio,
+            )
+            for i, det_idx in enumerate(matches.tolist()):
+                if det_idx >= 0:
+                    self._update_with_detection(i, detections[det_idx], frame)
+                    used_detections.add(det_idx)
         
-        for i, det in enumerate(detections):
-            if i not in used_detections:
-                self.tracks.append(FaceTrack(det, frame))
+        new_detections = [det for i, det in enumerate(detections) if i not in used_detections]
+        if new_detections:
+            self._add_tracks(new_detections, frame)
         
-        self.tracks = [t for t in self.tracks if t.is_valid()]
+        self._drop_stale_tracks()
+    
+    def update_trackers_only(self, frame):
+        """Advance tracks on a frame where detection was skipped."""
+        self._advance_trackers(frame)
+        self._drop_stale_tracks()
     
     def get_blur_regions(self):
-        return [track.get_blur_bbox() for track in self.tracks]
+        """Track boxes expanded by expand_ratio, as [x, y, w, h] lists."""
+        boxes = self.bboxes.astype(np.int64)
+        expand = (self.bboxes[:, 2:] * (self.expand_ratio / 2)).astype(np.int64)
+        return np.hstack([boxes[:, :2] - expand, boxes[:, 2:] + expand * 2]).tolist()